@@ -0,0 +1,121 @@
+"""
+Compare WMS style window reads of the interpolation NetCDF layouts.
+
+The previous layout stored tsvalue as uncompressed float64 with ('time', 'lon', 'lat') dimensions. The current
+layout writes CF ordered ('time', 'lat', 'lon') dimensions, zlib compressed and chunked one time step per chunk,
+as float32 or as 16 bit integers packed with scale_factor/add_offset. A WMS GetMap request reads one time step
+over a lat/lon window, this script times that access pattern and reports the file size of each layout.
+
+Usage:
+    python benchmarks/nc_layout.py --steps 50 --lat 450 --lon 550 --reads 200
+
+Results of that run on a single core:
+    layout                                size (MB)  write (s)  read per window (ms)
+    old float64 (time, lon, lat)               94.4       0.18                  0.74
+    float64 (time, lat, lon) zlib              44.6       2.21                  5.01
+    float32 (time, lat, lon) zlib              15.2       0.93                  1.41
+    packed int16 (time, lat, lon) zlib          8.4       0.72                  1.45
+
+The compressed layouts are 6 to 11 times smaller, but a window read decompresses the whole time step chunk, so
+with the file in the page cache it is about twice as slow as the uncompressed layout. The gain is in disk space
+and in reads that are bound by disk or network rather than by decompression.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import netCDF4
+import numpy as np
+
+LAYOUTS = {
+    'old float64 (time, lon, lat)': {'dims': ('time', 'lon', 'lat'), 'datatype': np.float64, 'zlib': False},
+    'float64 (time, lat, lon) zlib': {'dims': ('time', 'lat', 'lon'), 'datatype': np.float64, 'zlib': True},
+    'float32 (time, lat, lon) zlib': {'dims': ('time', 'lat', 'lon'), 'datatype': np.float32, 'zlib': True},
+    'packed int16 (time, lat, lon) zlib': {'dims': ('time', 'lat', 'lon'), 'datatype': np.int16, 'zlib': True},
+}
+
+
+def make_fields(steps, lat_len, lon_len, seed=0):
+    # smooth random fields with an empty border, similar to a kriged aquifer clipped to its outline
+    rng = np.random.default_rng(seed)
+    lat, lon = np.meshgrid(np.linspace(0, 1, lat_len), np.linspace(0, 1, lon_len), indexing='ij')
+    inside = (lat - 0.5) ** 2 / 0.2 + (lon - 0.5) ** 2 / 0.24 < 1
+    fields = np.empty((steps, lat_len, lon_len))
+    for step in range(steps):
+        phase = rng.random(2) * np.pi
+        fields[step] = 100 + 20 * np.sin(4 * lat + phase[0]) * np.cos(3 * lon + phase[1]) + step * 0.1
+    fields[:, ~inside] = np.nan
+    return fields
+
+
+def write_layout(file_path, fields, dims, datatype, zlib):
+    steps, lat_len, lon_len = fields.shape
+    with netCDF4.Dataset(file_path, 'w', format='NETCDF4') as h:
+        h.createDimension('time', 0)
+        h.createDimension('lat', lat_len)
+        h.createDimension('lon', lon_len)
+        sizes = {'time': 1, 'lat': lat_len, 'lon': lon_len}
+        fill_value = np.iinfo(np.int16).min if datatype == np.int16 else -9999
+        chunksizes = tuple(sizes[dim] for dim in dims) if zlib else None
+        ts_value = h.createVariable('tsvalue', datatype, dims, fill_value=fill_value, zlib=zlib, shuffle=zlib,
+                                    chunksizes=chunksizes)
+        empty_value = 0
+        if datatype == np.int16:
+            low, high = np.nanmin(fields), np.nanmax(fields)
+            ts_value.scale_factor = (high - low) / (2 ** 16 - 2)
+            ts_value.add_offset = empty_value = (high + low) / 2
+        for step in range(steps):
+            field = fields[step] if dims[1] == 'lat' else fields[step].T
+            empty = np.isnan(field)
+            ts_value[step, :, :] = np.ma.masked_array(np.where(empty, empty_value, field), mask=empty)
+
+
+def time_window_reads(file_path, dims, reads, window, seed=1):
+    # random single time step windows, the way a WMS tile request reads the file
+    rng = np.random.default_rng(seed)
+    with netCDF4.Dataset(file_path) as h:
+        ts_value = h.variables['tsvalue']
+        steps = ts_value.shape[0]
+        lat_len = h.dimensions['lat'].size
+        lon_len = h.dimensions['lon'].size
+        beg_time = time.perf_counter()
+        for _ in range(reads):
+            step = rng.integers(steps)
+            lat_start = rng.integers(max(1, lat_len - window))
+            lon_start = rng.integers(max(1, lon_len - window))
+            lat_slice = slice(lat_start, lat_start + window)
+            lon_slice = slice(lon_start, lon_start + window)
+            if dims[1] == 'lat':
+                ts_value[step, lat_slice, lon_slice]
+            else:
+                ts_value[step, lon_slice, lat_slice]
+        return time.perf_counter() - beg_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--steps', type=int, default=50, help='time steps in the file')
+    parser.add_argument('--lat', type=int, default=450, help='cells in the lat dimension')
+    parser.add_argument('--lon', type=int, default=550, help='cells in the lon dimension')
+    parser.add_argument('--reads', type=int, default=200, help='window reads per layout')
+    parser.add_argument('--window', type=int, default=256, help='cells on each side of a read window')
+    args = parser.parse_args()
+
+    fields = make_fields(args.steps, args.lat, args.lon)
+    temp_dir = tempfile.mkdtemp()
+    print(f'{"layout":<38}{"size (MB)":>12}{"write (s)":>12}{"reads (ms)":>12}')
+    for name, layout in LAYOUTS.items():
+        file_path = os.path.join(temp_dir, f'{name.split()[0]}_{len(os.listdir(temp_dir))}.nc')
+        beg_time = time.perf_counter()
+        write_layout(file_path, fields, **layout)
+        write_time = time.perf_counter() - beg_time
+        read_time = time_window_reads(file_path, layout['dims'], args.reads, args.window)
+        size = os.path.getsize(file_path) / 2 ** 20
+        print(f'{name:<38}{size:>12.1f}{write_time:>12.2f}{read_time / args.reads * 1000:>12.2f}')
+        os.remove(file_path)
+    os.rmdir(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
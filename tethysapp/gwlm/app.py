@@ -170,6 +170,11 @@ class Gwlm(TethysAppBase):
                 url='gwlm/add-aquifer/submit',
                 controller='gwlm.controllers_ajax.aquifer_add'
             ),
+            UrlMap(
+                name='add-aquifer-status',
+                url='gwlm/add-aquifer/status',
+                controller='gwlm.controllers_ajax.upload_status'
+            ),
             UrlMap(
                 name='add-wells',
                 url='gwlm/add-wells',
@@ -190,6 +195,11 @@ class Gwlm(TethysAppBase):
                 url='gwlm/add-wells/submit',
                 controller='gwlm.controllers_ajax.wells_add'
             ),
+            UrlMap(
+                name='add-wells-status',
+                url='gwlm/add-wells/status',
+                controller='gwlm.controllers_ajax.upload_status'
+            ),
             UrlMap(
                 name='edit-wells',
                 url='gwlm/edit-wells',
@@ -235,6 +245,11 @@ class Gwlm(TethysAppBase):
                 url='gwlm/add-measurements/submit',
                 controller='gwlm.controllers_ajax.measurements_add'
             ),
+            UrlMap(
+                name='add-measurements-status',
+                url='gwlm/add-measurements/status',
+                controller='gwlm.controllers_ajax.upload_status'
+            ),
             UrlMap(
                 name='add-variable',
                 url='gwlm/add-variable',
@@ -273,6 +288,25 @@ class Gwlm(TethysAppBase):
                 description='Path to the Ground Water Thredds Directory',
                 required=True
             ),
+            CustomSetting(
+                name='pdsi_netcdf_path',
+                type=CustomSetting.TYPE_STRING,
+                description='Optional path to a local monthly PDSI NetCDF file used instead of the NOAA THREDDS server',
+                required=False
+            ),
+            CustomSetting(
+                name='soilw_netcdf_path',
+                type=CustomSetting.TYPE_STRING,
+                description='Optional path to a local monthly soil moisture NetCDF file used instead of the NOAA '
+                            'THREDDS server',
+                required=False
+            ),
+            CustomSetting(
+                name='aquifer_workers',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Optional number of aquifers of a region interpolated at the same time (default 4)',
+                required=False
+            ),
         )
 
         return custom_settings
@@ -6,14 +6,16 @@ from tethys_sdk.compute import get_scheduler
 from tethys_sdk.gizmos import Button, TextInput, SelectInput
 from tethys_sdk.gizmos import JobsTable, PlotlyView
 
-# from .app import Gwlm as app
+from .app import Gwlm as app
 from .model import Variable
-from .utils import (get_regions,
+from .utils import (UPSERT_UNAVAILABLE,
+                    get_regions,
                     get_aquifers_list,
                     get_geoserver_status,
                     get_num_wells,
                     get_num_measurements,
                     get_variable_list,
+                    measurement_upsert_available,
                     get_metrics,
                     geoserver_text_gizmo,
                     get_region_select,
@@ -21,11 +23,12 @@ from .utils import (get_regions,
                     get_aquifer_select,
                     get_variable_select,
                     thredds_text_gizmo,
+                    get_job_status,
                     get_session_obj)
 from .utils import user_permission_test
 
 # get job manager for the app
-# job_manager = app.get_job_manager()
+job_manager = app.get_job_manager()
 
 
 def home(request):
@@ -156,6 +159,13 @@ def interpolation(request):
     ratios = [(f'{i}%', float(i) / 100) for i in range(5, 105, 5)]
     ratios.append(("No Minimum", 0))
 
+    select_neighborhood = SelectInput(display_text='Wells to use for estimating a block',
+                                      name='select-neighborhood',
+                                      multiple=False,
+                                      options=[('All Wells', 'global'),
+                                               ('Wells within the Search Radius (Min/Max Wells)', 'local')],
+                                      initial='All Wells'
+                                      )
     select_search_radius = SelectInput(display_text='Specify search radius in degrees',
                                        name='select-search-radius',
                                        multiple=False,
@@ -246,6 +256,29 @@ def interpolation(request):
                         name='spacing-input',
                         initial='1MS',
                         )
+    variogram_policy = SelectInput(display_text='Variogram Fitting',
+                                   name='variogram-policy',
+                                   multiple=False,
+                                   options=[('Refit Every Time Step', 'every'), ('Fit Once', 'once'),
+                                            ('Refit Every N Time Steps', 'every_n'),
+                                            ('Refit When the Variance Shifts', 'variance')],
+                                   initial='Refit Every Time Step'
+                                   )
+
+    variogram_refit_every = TextInput(display_text='Time Steps Between Variogram Fits (N)',
+                                      name='variogram-refit-input',
+                                      initial='5',
+                                      )
+
+    hidden_units = TextInput(display_text='Imputation Hidden Units',
+                             name='hidden-units-input',
+                             initial='500',
+                             )
+
+    lamb_value = TextInput(display_text='Imputation Regularization (Lambda)',
+                           name='lamb-value-input',
+                           initial='100',
+                           )
     # 'gap_size': '365 days',
     # 'pad': '90',
     # 'spacing': '1MS'
@@ -264,6 +297,7 @@ def interpolation(request):
         'select_porosity': select_porosity,
         'select_interpolation': select_interpolation,
         'temporal_interpolation': temporal_interpolation,
+        'select_neighborhood': select_neighborhood,
         'select_ndmin': select_ndmin,
         'select_ndmax': select_ndmax,
         'select_search_radius': select_search_radius,
@@ -279,6 +313,10 @@ def interpolation(request):
         'gap_size': gap_size,
         'pad': pad,
         'spacing': spacing,
+        'variogram_policy': variogram_policy,
+        'variogram_refit_every': variogram_refit_every,
+        'hidden_units': hidden_units,
+        'lamb_value': lamb_value,
         'add_button': add_button
     }
     return render(request, 'gwlm/interpolation.html', context)
@@ -458,7 +496,9 @@ def add_measurements(request):
         'aquifer_select': aquifer_select,
         'variable_select': variable_select,
         'attributes_button': attributes_button,
-        'format_text_input': format_text_input
+        'format_text_input': format_text_input,
+        'upsert_available': measurement_upsert_available(),
+        'upsert_unavailable_message': UPSERT_UNAVAILABLE
     }
     return render(request, 'gwlm/add_measurements.html', context)
 
@@ -596,7 +636,15 @@ def run_job(request, job_type):
 
 def jobs_table(request):
     # Use job manager to get all the jobs.
-    jobs = job_manager.list_jobs(order_by='-id', filters=None)
+    jobs = list(job_manager.list_jobs(order_by='-id', filters=None))
+
+    # Show the aquifer/time step progress reported by running interpolation jobs
+    for job in jobs:
+        progress_id = job.extended_properties.get('progress_id')
+        if progress_id is not None:
+            job_status = get_job_status(progress_id)
+            if job_status is not None and job_status['message']:
+                job.description = job_status['message']
 
     # Table View
     jobs_table_options = JobsTable(
@@ -1,5 +1,6 @@
 import json
 import math
+from datetime import datetime
 
 from django.contrib.auth.decorators import user_passes_test
 from django.http import JsonResponse
@@ -11,17 +12,24 @@ from tethys_sdk.compute import get_scheduler
 # get job manager for the app
 from .app import Gwlm as app
 job_manager = app.get_job_manager()
-from .interpolation_utils import process_interpolation
+from .job_functions import (delayed_job,
+                            submit_upload_job)
 from .model import (Region,
                     Aquifer,
                     Variable,
                     Well)
-from .utils import (create_outlier,
+from .utils import (MEASUREMENT_BATCH_SIZE,
+                    UPLOAD_CHUNK_SIZE,
+                    UPSERT_UNAVAILABLE,
+                    create_job_status,
+                    create_outlier,
                     get_session_obj,
+                    parse_upload_size,
                     user_permission_test,
                     process_region_shapefile,
                     process_aquifer_shapefile,
                     get_shapefile_attributes,
+                    get_job_status,
                     get_timeseries,
                     get_well_obs,
                     get_well_info,
@@ -29,8 +37,11 @@ from .utils import (create_outlier,
                     get_wms_metadata,
                     get_region_aquifers_list,
                     get_region_variables_list,
+                    measurement_upsert_available,
                     process_wells_file,
-                    process_measurements_file)
+                    process_measurements_file,
+                    save_upload_files,
+                    update_job_status)
 
 
 @user_passes_test(user_permission_test)
@@ -154,14 +165,16 @@ def aquifer_add(request, app_workspace):
         id_attr = info.get('id_attribute')
 
         shapefile = request.FILES.getlist('shapefile')
+        upload_dir = save_upload_files(shapefile, app_workspace)
 
-        response = process_aquifer_shapefile(shapefile,
-                                             region_id,
-                                             name_attr,
-                                             id_attr,
-                                             app_workspace)
+        job_id = submit_upload_job('aquifer', process_aquifer_shapefile, upload_dir,
+                                   shapefile=upload_dir,
+                                   region_id=region_id,
+                                   name_attr=name_attr,
+                                   id_attr=id_attr,
+                                   app_workspace=app_workspace)
 
-        return JsonResponse(response)
+        return JsonResponse({'success': 'success', 'job_id': job_id})
 
 
 @user_passes_test(user_permission_test)
@@ -389,12 +402,20 @@ def wells_add(request, app_workspace):
         aquifer_id = info.get('aquifer_id')
         aquifer_col = info.get('aquifer_col')
         region_id = int(info.get('region_id'))
-        response = process_wells_file(lat, lon, well_id, name,
-                                      gse, attributes, file,
-                                      aquifer_id, aquifer_col,
-                                      app_workspace, region_id)
+        try:
+            chunk_size = parse_upload_size(info.get('chunk_size'), UPLOAD_CHUNK_SIZE)
+        except ValueError:
+            return JsonResponse({'error': 'Chunk size must be a whole number of at least 1.'})
+        upsert = info.get('upsert') == 'true'
+        upload_dir = save_upload_files(file, app_workspace)
+        job_id = submit_upload_job('wells', process_wells_file, upload_dir,
+                                   lat=lat, lon=lon, well_id=well_id, name=name,
+                                   gse=gse, attrs=attributes, file=upload_dir,
+                                   aquifer_id=aquifer_id, aquifer_col=aquifer_col,
+                                   app_workspace=app_workspace, region_id=region_id,
+                                   chunk_size=chunk_size, upsert=upsert)
 
-        return JsonResponse(response)
+        return JsonResponse({'success': 'success', 'job_id': job_id})
 
 
 @user_passes_test(user_permission_test)
@@ -477,10 +498,40 @@ def measurements_add(request, app_workspace):
         region_id = int(info.get("region_id"))
         aquifer_id = info.get('aquifer_id')
         aquifer_col = info.get('aquifer_col')
-        response = process_measurements_file(region_id, well_id, time, value,
-                                             time_format, variable_id, file,
-                                             aquifer_id, aquifer_col,
-                                             app_workspace)
+        try:
+            batch_size = parse_upload_size(info.get('batch_size'), MEASUREMENT_BATCH_SIZE)
+            chunk_size = parse_upload_size(info.get('chunk_size'), UPLOAD_CHUNK_SIZE)
+        except ValueError:
+            return JsonResponse({'error': 'Batch size and chunk size must be whole numbers of at least 1.'})
+        upsert = info.get('upsert') == 'true'
+        if upsert and not measurement_upsert_available():
+            return JsonResponse({'error': UPSERT_UNAVAILABLE})
+        upload_dir = save_upload_files(file, app_workspace)
+        job_id = submit_upload_job('measurements', process_measurements_file, upload_dir,
+                                   region_id=region_id, well_id=well_id, m_time=time, value=value,
+                                   time_format=time_format, variable_id=variable_id, file=upload_dir,
+                                   aquifer_id=aquifer_id, aquifer_col=aquifer_col,
+                                   app_workspace=app_workspace, batch_size=batch_size,
+                                   chunk_size=chunk_size, upsert=upsert)
+
+        return JsonResponse({'success': 'success', 'job_id': job_id})
+
+
+@user_passes_test(user_permission_test)
+def upload_status(request):
+    """
+    Ajax controller to poll the progress of an upload running in the background
+    """
+    if request.is_ajax() and request.method == 'POST':
+        info = request.POST
+
+        job_id = info.get('job_id')
+        job_status = get_job_status(job_id)
+        if job_status is None:
+            return JsonResponse({'error': 'The upload job does not exist.'})
+
+        response = {'success': 'success'}
+        response.update(job_status)
 
         return JsonResponse(response)
 
@@ -494,7 +545,16 @@ def region_timeseries(request):
         info = request.POST
         well_id = info.get('well_id')
         variable_id = int(info.get('variable_id'))
-        timeseries = get_timeseries(well_id, variable_id)
+        start_date = info.get('start_date')
+        end_date = info.get('end_date')
+        try:
+            start_date = datetime.fromisoformat(start_date) if start_date else None
+            end_date = datetime.fromisoformat(end_date) if end_date else None
+        except ValueError:
+            return JsonResponse({'error': 'Start and end dates must be ISO dates (YYYY-MM-DD).'})
+        if start_date is not None and end_date is not None and start_date > end_date:
+            return JsonResponse({'error': 'The start date must not be after the end date.'})
+        timeseries = get_timeseries(well_id, variable_id, start_date, end_date)
         response['success'] = 'success'
         response['timeseries'] = timeseries
         response['well_info'] = get_well_info(well_id)
@@ -641,29 +701,36 @@ def interpolate(request):
     response = {}
     if request.is_ajax() and request.method == 'POST':
         # get/check information from AJAX request
+        progress_id = None
         try:
             post_info = request.POST
             scheduler = get_scheduler(name='dask_local')
 
             info_dict = post_info.dict()
-            result = process_interpolation(info_dict)
-            # from .job_functions import delayed_job
-            # #
-            # # Create dask delayed object
-            # delayed = delayed_job(info_dict)
-            # dask = job_manager.create_job(
-            #     job_type='DASK',
-            #     name='dask_delayed',
-            #     user=request.user,
-            #     scheduler=scheduler,
-            # )
-            #
-            # # Execute future
-            # dask.execute(delayed)
+            # Progress per aquifer and time step is written to the job status table by the job itself
+            progress_id = create_job_status('interpolation')
+            info_dict['progress_id'] = progress_id
+
+            # Create dask delayed object
+            delayed = delayed_job(info_dict)
+            dask = job_manager.create_job(
+                job_type='DASK',
+                name=f'interpolation_{info_dict["region"]}_{info_dict["aquifer"]}_{info_dict["variable"]}',
+                description='Queued',
+                user=request.user,
+                scheduler=scheduler,
+                extended_properties={'progress_id': progress_id},
+            )
+
+            # Execute future
+            dask.execute(delayed)
             response['success'] = 'success'
-            response['result'] = result
+            response['job_id'] = dask.id
         except Exception as e:
             response['error'] = str(e)
+            if progress_id is not None:
+                # the job never started, do not leave it pending in the jobs table
+                update_job_status(progress_id, status='error', message=str(e))
 
         return JsonResponse(response)
 
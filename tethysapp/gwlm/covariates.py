@@ -0,0 +1,246 @@
+import abc
+import datetime
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree as ET
+
+import numpy as np
+import pandas as pd
+import requests
+import xarray
+
+from .app import Gwlm as app
+
+SERVER1 = "https://www.esrl.noaa.gov/psd/thredds/wms/Datasets/dai_pdsi/pdsi.mon.mean.selfcalibrated.nc"
+LAYER1 = "pdsi"  # name of data column to be returned
+SERVER2 = "https://www.esrl.noaa.gov/psd/thredds/wms/Datasets/cpcsoil/soilw.mon.mean.nc"
+LAYER2 = "soilw"  # name of data column to be returned
+COVARIATE_CACHE_DIR = 'covariate_cache'  # app workspace directory of the cached THREDDS covariates
+COVARIATE_CACHE_TTL = datetime.timedelta(days=30)  # the covariates are monthly, refresh the cache once a month
+COVARIATE_WORKERS = 4  # covariates fetched at the same time
+HTTP_TIMEOUT = (10, 120)  # seconds to connect and to wait for data from the THREDDS server
+TIME_BOUNDS_TTL = COVARIATE_CACHE_TTL / 30  # new months show up on the server, re-read the capabilities daily
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_time_bounds = {}
+_time_bounds_lock = threading.Lock()
+
+
+def get_http_session():
+    # one pooled session per process, so repeated requests to the same server reuse their connections
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=COVARIATE_WORKERS)
+            _http_session.mount('http://', adapter)
+            _http_session.mount('https://', adapter)
+    return _http_session
+
+
+def get_xml_root(url):
+    response = get_http_session().get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return ET.fromstring(response.content)
+
+
+def get_time_bounds(url, ttl=TIME_BOUNDS_TTL):
+    # This function returns the first and last available time
+    # from a url of a getcapabilities page located on a Thredds Server
+    # memoized per url for ttl (a datetime.timedelta), so a long running process still sees new months
+    with _time_bounds_lock:
+        cached = _time_bounds.get(url)
+    if cached is not None and time.time() - cached[0] <= ttl.total_seconds():
+        return cached[1]
+    root = get_xml_root(url)
+    # These lines of code find the time dimension information for the netcdf on the Thredds server
+    dim = root.findall('.//{http://www.opengis.net/wms}Dimension')
+    dim = dim[0].text
+    times = dim.split(',')
+    times.pop(0)
+    timemin = times[0]
+    timemax = times[-1]
+    # timemin and timemax are the first and last available times on the specified url
+    with _time_bounds_lock:
+        _time_bounds[url] = (time.time(), (timemin, timemax))
+    return timemin, timemax
+
+
+def get_thredds_value(server, layer, bbox):
+    # This function returns a pandas dataframe of the timeseries values of a specific layer
+    # at a specific latitude and longitude from a file on a Thredds server
+    # server: the url of the netcdf desired netcdf file on the Thredds server to read
+    # layer: the name of the layer to extract timeseries information from for the netcdf file
+    # lat: the latitude of the point at which to extract the timeseries
+    # lon: the longitude of the point at which to extract the timeseries
+    # returns df: a pandas dataframe of the timeseries at lat and lon for the layer in the server netcdf file
+    # calls the getTimeBounds function to get the first and last available times for the netcdf file on the server
+    time_min, time_max = get_time_bounds(server + "?service=WMS&version=1.3.0&request=GetCapabilities")
+    # These lines properly format a url request for the timeseries of a speific layer from a netcdf on
+    # a Thredds server
+    server = f'{server}?service=WMS&version=1.3.0&request=GetFeatureInfo&CRS=CRS:84&QUERY_LAYERS={layer}'
+    server = f'{server}&X=0&Y=0&I=0&J=0&BBOX={bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]}'
+    server = f'{server}&WIDTH=1&Height=1&INFO_FORMAT=text/xml'
+    server = f'{server}&TIME={time_min}/{time_max}'
+    root = get_xml_root(server)
+    features = root.findall('FeatureInfo')
+    times = []
+    values = []
+    for child in features:
+        time = datetime.datetime.strptime(child[0].text, "%Y-%m-%dT%H:%M:%S.%fZ")
+        times.append(time)
+        values.append(child[1].text)
+
+    df = pd.DataFrame(index=times, columns=[layer], data=values)
+    df[layer] = df[layer].replace('none', np.nan).astype(float)
+    return df
+
+
+def covariate_cache_path(server, layer, bbox, cache_dir=None):
+    # cache files are keyed by server, layer and bbox, stored in the app workspace unless cache_dir is given
+    if cache_dir is None:
+        cache_dir = os.path.join(app.get_app_workspace().path, COVARIATE_CACHE_DIR)
+    bbox_key = ','.join(f'{coord:.6f}' for coord in bbox)
+    key = hashlib.sha1(f'{server}|{layer}|{bbox_key}'.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f'{layer}_{key}.nc')
+
+
+def covariate_cache_expired(cache_file, ttl):
+    # ttl is a datetime.timedelta, None keeps cache files forever
+    if ttl is None:
+        return False
+    return time.time() - os.path.getmtime(cache_file) > ttl.total_seconds()
+
+
+def evict_covariate_cache(cache_dir, ttl):
+    # delete the cache files older than ttl
+    if ttl is None or not os.path.isdir(cache_dir):
+        return
+    for file_name in os.listdir(cache_dir):
+        cache_file = os.path.join(cache_dir, file_name)
+        if file_name.endswith('.nc') and covariate_cache_expired(cache_file, ttl):
+            os.remove(cache_file)
+
+
+def read_covariate_cache(cache_file):
+    with xarray.open_dataset(cache_file) as cache_ds:
+        df = cache_ds.to_dataframe()
+    df.index.name = None
+    return df
+
+
+def write_covariate_cache(df, cache_file, server, layer, bbox):
+    # write to a temporary file and rename, so parallel aquifer runs never read a partial file
+    cache_dir = os.path.dirname(cache_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_ds = df.rename_axis('time').to_xarray()
+    cache_ds.attrs.update({'server': server, 'layer': layer, 'bbox': ','.join(str(coord) for coord in bbox)})
+    temp_fd, temp_file = tempfile.mkstemp(suffix='.nc', dir=cache_dir)
+    os.close(temp_fd)
+    cache_ds.to_netcdf(temp_file)
+    os.replace(temp_file, cache_file)
+
+
+def get_cached_thredds_value(server, layer, bbox, cache_dir=None, ttl=COVARIATE_CACHE_TTL):
+    # get_thredds_value backed by a NetCDF file cache, repeat requests for the same server, layer and bbox
+    # are read from disk until the cache file is older than ttl
+    cache_file = covariate_cache_path(server, layer, bbox, cache_dir)
+    if os.path.exists(cache_file) and not covariate_cache_expired(cache_file, ttl):
+        return read_covariate_cache(cache_file)
+
+    try:
+        df = get_thredds_value(server, layer, bbox)
+    except OSError as e:
+        # requests errors are OSErrors, an expired cache beats no covariates when the server is unreachable
+        if os.path.exists(cache_file):
+            print(f'Using expired covariate cache {cache_file}: {e}')
+            return read_covariate_cache(cache_file)
+        raise
+
+    write_covariate_cache(df, cache_file, server, layer, bbox)
+    evict_covariate_cache(os.path.dirname(cache_file), ttl)
+    return df
+
+
+class CovariateProvider(abc.ABC):
+    """
+    Source of a monthly covariate grid used to impute well data. get_values returns a DataFrame indexed by time
+    with a single column named after the layer, holding the covariate over an aquifer bbox.
+    """
+    def __init__(self, layer):
+        self.layer = layer
+
+    @abc.abstractmethod
+    def get_values(self, bbox):
+        pass
+
+
+class WMSCovariateProvider(CovariateProvider):
+    """
+    Covariate read point by point from a THREDDS WMS GetFeatureInfo request, cached on disk
+    """
+    def __init__(self, server, layer, cache_dir=None, ttl=COVARIATE_CACHE_TTL):
+        super().__init__(layer)
+        self.server = server
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def get_values(self, bbox):
+        return get_cached_thredds_value(self.server, self.layer, bbox, self.cache_dir, self.ttl)
+
+
+class NetCDFCovariateProvider(CovariateProvider):
+    """
+    Covariate read from a local NetCDF grid. The file is opened lazily and only the cell nearest to the bbox center
+    is read, the same point the WMS GetFeatureInfo request returns, so both providers agree.
+    """
+    def __init__(self, file_path, layer, variable=None, lat_name='lat', lon_name='lon', time_name='time'):
+        super().__init__(layer)
+        self.file_path = file_path
+        self.variable = variable or layer
+        self.lat_name = lat_name
+        self.lon_name = lon_name
+        self.time_name = time_name
+
+    def get_values(self, bbox):
+        min_x, min_y, max_x, max_y = bbox
+        center_x, center_y = (min_x + max_x) / 2, (min_y + max_y) / 2
+        with xarray.open_dataset(self.file_path) as grid_ds:
+            grid = grid_ds[self.variable]
+            # grids with 0 to 360 longitudes
+            if grid[self.lon_name].values.max() > 180 and center_x < 0:
+                center_x += 360
+            values = grid.sel({self.lat_name: center_y, self.lon_name: center_x}, method='nearest').load()
+
+        df = pd.DataFrame(index=pd.DatetimeIndex(values[self.time_name].values), columns=[self.layer],
+                          data=values.values.astype(float))
+        df.index.name = None
+        return df
+
+
+def get_covariate_providers():
+    # the drought covariates used by the MLR imputation, read from local NetCDF files when the optional
+    # pdsi_netcdf_path / soilw_netcdf_path settings are set and from the NOAA THREDDS server otherwise
+    providers = []
+    for server, layer in ((SERVER1, LAYER1), (SERVER2, LAYER2)):
+        local_path = app.get_custom_setting(f'{layer}_netcdf_path')
+        if local_path:
+            providers.append(NetCDFCovariateProvider(local_path, layer))
+        else:
+            providers.append(WMSCovariateProvider(server, layer))
+    return providers
+
+
+def get_covariates(bbox, providers=None):
+    # returns one column per covariate provider over the bbox
+    if providers is None:
+        providers = get_covariate_providers()
+    # fetched concurrently, the time is spent waiting on the server or the disk
+    with ThreadPoolExecutor(max_workers=max(1, min(COVARIATE_WORKERS, len(providers)))) as executor:
+        covariate_dfs = list(executor.map(lambda provider: provider.get_values(bbox), providers))
+    return pd.concat(covariate_dfs, join="outer", axis=1)
@@ -1,43 +1,67 @@
 import calendar
 import copy
 import datetime
+import hashlib
+import itertools
 import os
-import shutil
 import tempfile
 import time
-import urllib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from timeit import default_timer as timer
-from urllib import request
-from xml.etree import cElementTree as ET
 
-import geopandas as gpd
 import gstools as gs
 import matplotlib.backends.backend_pdf as plt_pdf
 import matplotlib.pyplot as plt
 import netCDF4
 import numpy as np
 import pandas as pd
+import rasterio.crs
+import rasterio.features
+import rasterio.transform
 import scipy.interpolate as sci_intrp
-import xarray
-import rioxarray
 from geoalchemy2 import functions as gf2
-from scipy import interpolate
+from scipy import interpolate, spatial
 from shapely import wkt
 from shapely.geometry import mapping
 
 from .app import Gwlm as app
+from .covariates import get_covariates
+from .kriging import KRIG_CHUNK_SIZE, NEIGHBOR_QUERY_SIZE, make_kriging_system
 from .model import (Aquifer,
                     Well,
-                    Measurement)
+                    Measurement,
+                    JobStatus)
+from .ridge_solver import solve_masked_ridge
 from .utils import (get_session_obj,
-                    get_region_aquifers_list)
+                    get_region_aquifers_list,
+                    update_job_status)
 
-SERVER1 = "https://www.esrl.noaa.gov/psd/thredds/wms/Datasets/dai_pdsi/pdsi.mon.mean.selfcalibrated.nc"
-LAYER1 = "pdsi"  # name of data column to be returned
-SERVER2 = "https://www.esrl.noaa.gov/psd/thredds/wms/Datasets/cpcsoil/soilw.mon.mean.nc"
-LAYER2 = "soilw"  # name of data column to be returned
 YEARS = [1, 3, 5, 10]
+HIDDEN_UNITS = 500  # hidden units of the extreme learning machine used to impute well data
+LAMB_VALUE = 100  # ridge regularization of the extreme learning machine
+VARIOGRAM_EVERY = 'every'  # variogram policies, see variogram_fit_steps
+VARIOGRAM_ONCE = 'once'
+VARIOGRAM_EVERY_N = 'every_n'
+VARIOGRAM_VARIANCE = 'variance'
+VARIOGRAM_REFIT_EVERY = 5  # time steps between variogram fits for the every_n policy
+VARIOGRAM_VARIANCE_SHIFT = 0.25  # relative change in variance that triggers a refit for the variance policy
+IDW = 'IDW'  # spatial_interpolation value for inverse distance weighting, anything else krigs
+IDW_POWER = 2  # distance power of the inverse distance weights
+AQUIFER_MASK_DIR = 'aquifer_masks'  # app workspace directory of the cached aquifer grid masks
+NC_COMPLEVEL = 4  # zlib compression level of the interpolation NetCDF files
+NC_FLOAT64 = 'float64'  # tsvalue encodings, see nc_value_encoding
+NC_FLOAT32 = 'float32'
+NC_PACKED = 'packed'
+NC_ENCODINGS = (NC_FLOAT64, NC_FLOAT32, NC_PACKED)
+NC_PACKED_MARGIN = 0.5  # share of the well value range added on both sides of the packed range
+NC_CRS_WKT = rasterio.crs.CRS.from_epsg(4326).to_wkt()
+MAX_GRID_CELLS = 250000  # cap on the cells of an interpolation grid, coarser resolutions are used above it
+OUTPUT_TIME_TOLERANCE = pd.Timedelta(days=31)  # furthest imputed value used for an output time step
+NO_MAXIMUM = 999  # ndmax value of the interpolation wizard's "No Maximum" option
+NEIGHBORHOOD_GLOBAL = 'global'  # neighborhood values, global uses every well for every cell
+NEIGHBORHOOD_LOCAL = 'local'  # local limits the wells of each cell to search_radius, ndmin and ndmax
+AQUIFER_WORKERS = 4  # default aquifers interpolated at once, their time steps share the cores, see get_aquifer_workers
 
 
 def smooth(y, box_size):
@@ -68,103 +92,48 @@ def extract_well_data(name, well_df, end_date, min_samples):
 
 
 def interp_well(wells_df, gap_size, pad, spacing):
-    well_interp_df = pd.DataFrame()
     # create a time index to interpolate over - cover entire range
     interp_index: pd.DatetimeIndex = pd.date_range(start=min(wells_df.index),
                                                    freq=spacing,
                                                    end=max(wells_df.index))
+    interp_times = np.asarray(interp_index, dtype='datetime64[ns]').astype(np.int64)
+    gap_ns = pd.Timedelta(gap_size).value
+    pad_ns = pd.Timedelta(days=int(pad)).value
+
+    # fill a preallocated array one well (column) at a time, blanked values stay nan
+    interp_values = np.full((len(interp_index), wells_df.shape[1]), np.nan)
+    wells_df = wells_df.sort_index()
+    well_times = np.asarray(wells_df.index, dtype='datetime64[ns]').astype(np.int64)
     # loop over each well, interpolate data using pchip
-    for well in wells_df:
-        temp_df = wells_df[well].dropna()  # available data for a well
-
-        x_index = temp_df.index.astype('int')  # dates for available data
-
-        x_diff = temp_df.index.to_series().diff()  # data gap sizes
-
-        fit2 = interpolate.pchip(x_index, temp_df)  # pchip fit to data
-
-        ynew = fit2(interp_index.astype('int'))  # interpolated data on full range
-
-        interp_df = pd.DataFrame(ynew, index=interp_index, columns=[well])
-
-        # replace data in gaps of > 1 year with nans
-
-        gaps = np.where(x_diff > gap_size)  # list of indexes where gaps are large
-
-        for g in gaps[0]:
-            start = x_diff.index[g - 1] + datetime.timedelta(days=pad)
-
-            end = x_diff.index[g] - datetime.timedelta(days=pad)
-
-            interp_df[start:end] = np.nan
-
-        beg_meas_date = x_diff.index[0]  # date of 1st measured point
-
-        end_meas_date = temp_df.index[-1]  # date of last measured point
-
-        mask1 = (interp_df.index < beg_meas_date)  # locations of data before 1st measured point
-
-        interp_df[mask1] = np.nan  # blank out data before 1st measured point
-
-        mask2 = (interp_df.index >= end_meas_date)  # locations of data after the last measured point
-
-        interp_df[mask2] = np.nan  # blank data from last measured point
-
-        # add the interp_df data to the full data frame
-
-        well_interp_df = pd.concat([well_interp_df, interp_df], join="outer", axis=1, sort=False)
+    for col, well in enumerate(wells_df):
+        values = wells_df[well].values
+        measured = ~np.isnan(values)
+        x_times = well_times[measured]  # dates for available data
+        if len(x_times) < 2:
+            continue
+        # only interpolate between the 1st measured point and the last measured point (exclusive)
+        inside = (interp_times >= x_times[0]) & (interp_times < x_times[-1])
+
+        # replace data in gaps of > gap_size with nans, keeping pad days next to the measured points on each side
+        # prev is the last measured point at least pad days before each time
+        prev = np.searchsorted(x_times + pad_ns, interp_times, side='right') - 1
+        prev = np.clip(prev, 0, len(x_times) - 2)
+        large_gap = np.diff(x_times) > gap_ns
+        in_gap = (large_gap[prev] &
+                  (interp_times >= x_times[prev] + pad_ns) &
+                  (interp_times <= x_times[prev + 1] - pad_ns))
+        # with no pad a gap also includes the measured point that ends it
+        before = np.maximum(prev - 1, 0)
+        in_gap |= (prev > 0) & large_gap[before] & (interp_times <= x_times[prev] - pad_ns)
+
+        keep = inside & ~in_gap
+        fit2 = interpolate.pchip(x_times, values[measured])  # pchip fit to data
+        interp_values[keep, col] = fit2(interp_times[keep])  # interpolated data on full range
+
+    well_interp_df = pd.DataFrame(interp_values, index=interp_index, columns=wells_df.columns)
     return well_interp_df
 
 
-def get_time_bounds(url):
-    # This function returns the first and last available time
-    # from a url of a getcapabilities page located on a Thredds Server
-    f = urllib.request.urlopen(url)
-    tree = ET.parse(f)
-    root = tree.getroot()
-    # These lines of code find the time dimension information for the netcdf on the Thredds server
-    dim = root.findall('.//{http://www.opengis.net/wms}Dimension')
-    dim = dim[0].text
-    times = dim.split(',')
-    times.pop(0)
-    timemin = times[0]
-    timemax = times[-1]
-    # timemin and timemax are the first and last available times on the specified url
-    return timemin, timemax
-
-
-def get_thredds_value(server, layer, bbox):
-    # This function returns a pandas dataframe of the timeseries values of a specific layer
-    # at a specific latitude and longitude from a file on a Thredds server
-    # server: the url of the netcdf desired netcdf file on the Thredds server to read
-    # layer: the name of the layer to extract timeseries information from for the netcdf file
-    # lat: the latitude of the point at which to extract the timeseries
-    # lon: the longitude of the point at which to extract the timeseries
-    # returns df: a pandas dataframe of the timeseries at lat and lon for the layer in the server netcdf file
-    # calls the getTimeBounds function to get the first and last available times for the netcdf file on the server
-    time_min, time_max = get_time_bounds(server + "?service=WMS&version=1.3.0&request=GetCapabilities")
-    # These lines properly format a url request for the timeseries of a speific layer from a netcdf on
-    # a Thredds server
-    server = f'{server}?service=WMS&version=1.3.0&request=GetFeatureInfo&CRS=CRS:84&QUERY_LAYERS={layer}'
-    server = f'{server}&X=0&Y=0&I=0&J=0&BBOX={bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]}'
-    server = f'{server}&WIDTH=1&Height=1&INFO_FORMAT=text/xml'
-    server = f'{server}&TIME={time_min}/{time_max}'
-    f = request.urlopen(server)
-    tree = ET.parse(f)
-    root = tree.getroot()
-    features = root.findall('FeatureInfo')
-    times = []
-    values = []
-    for child in features:
-        time = datetime.datetime.strptime(child[0].text, "%Y-%m-%dT%H:%M:%S.%fZ")
-        times.append(time)
-        values.append(child[1].text)
-
-    df = pd.DataFrame(index=times, columns=[layer], data=values)
-    df[layer] = df[layer].replace('none', np.nan).astype(float)
-    return df
-
-
 def sat_resample(gldas_df):
     # resamples the data from both datasets to a monthly value,
     # uses the mean of all measurements in a month
@@ -215,39 +184,27 @@ def predict(in_values, W_in, b, W_out):
     return y
 
 
-def impute_data(comb_df, well_names, names):
-    # for out test set we will impute everything
-    imputed_df = pd.DataFrame(index=comb_df.index)
-    for well in well_names:  # list of the wells in the aquifer
-        train_nona_df = comb_df.dropna(subset=[well])  # drop any rows with na in well (measured) data
-        labels_df = train_nona_df[well]  # measured data used as "labels" or truth in training
-        tx_df = train_nona_df[names]  # data we will predict with only over the test period
-        all_tx_df = comb_df[names]  # data over the full period, will use for imputation
-
-        tx = tx_df.values  # convert to an array
-        x1 = np.column_stack(np.ones(tx.shape[0])).T  # bias vector of 1's
-        tx = np.hstack((tx, x1))  # training matrix
-        ty = labels_df.values
-        input_length = tx.shape[1]
-        hidden_units = 500
-        lamb_value = 100
-        W_in = np.random.normal(size=[input_length, hidden_units])
-        b = np.random.normal(size=[hidden_units])
-        print('Well Number ', well)
-
-        # now do the matrix multiplication
-        X = input_to_hidden(tx, W_in, b)  # setup matrix for multiplication, it is a function
-        I = np.identity(X.shape[1])
-        I[X.shape[1] - 1, X.shape[1] - 1] = 0
-        I[X.shape[1] - 2, X.shape[1] - 2] = 0
-        W_out = np.linalg.lstsq(X.T.dot(X) + lamb_value * I, X.T.dot(ty), rcond=-1)[0]
-        all_tx_values = all_tx_df.values
-        a1 = np.column_stack(np.ones(all_tx_values.shape[0])).T
-        all_tx_values = np.hstack((all_tx_values, a1))
-        predict_values = predict(all_tx_values, W_in, b, W_out)  # it is a function
-        pre_name = f'{well}_imputed'
-        imputed_df[pre_name] = pd.Series(predict_values, index=imputed_df.index)
-
+def impute_data(comb_df, well_names, names, hidden_units=HIDDEN_UNITS, lamb_value=LAMB_VALUE):
+    # batched extreme learning machine, every well shares one random projection and the hidden layer is computed once,
+    # each well's ridge system only uses the rows where the well was measured
+    all_tx_values = comb_df[names].values  # data over the full period, will use for imputation
+    a1 = np.column_stack(np.ones(all_tx_values.shape[0])).T  # bias vector of 1's
+    all_tx_values = np.hstack((all_tx_values, a1))
+    input_length = all_tx_values.shape[1]
+    W_in = np.random.normal(size=[input_length, hidden_units])
+    b = np.random.normal(size=[hidden_units])
+    X = input_to_hidden(all_tx_values, W_in, b)  # hidden layer for all rows, shared by all wells
+
+    labels = comb_df[well_names].values  # measured data used as "labels" or truth in training, NaN if not measured
+    # the last two hidden units are left unregularized
+    penalty = np.ones(hidden_units)
+    penalty[-2:] = 0
+    print('Imputing wells ', len(well_names))
+    W_out = solve_masked_ridge(X, labels, lamb_value, penalty)
+
+    predict_values = np.dot(X, W_out)
+    imputed_df = pd.DataFrame(predict_values, index=comb_df.index,
+                              columns=[f'{well}_imputed' for well in well_names])
     return imputed_df
 
 
@@ -285,6 +242,58 @@ def create_grid_coords(x_c, y_c, x_steps):
     return grid_x, grid_y
 
 
+def create_resolution_grid(bbox, resolution, max_cells=MAX_GRID_CELLS):
+    # grid cell centers covering bbox (min x, min y, max x, max y) at resolution degrees
+    # cells are aligned to multiples of the resolution, so grids of neighbouring runs line up
+    # the resolution is coarsened when the grid would have more than max_cells cells
+    min_x, min_y, max_x, max_y = bbox
+    resolution = float(resolution)
+    # aligning to the resolution can add a cell on each axis
+    cells = (np.ceil((max_x - min_x) / resolution) + 1) * (np.ceil((max_y - min_y) / resolution) + 1)
+    if cells > max_cells:
+        resolution = resolution * np.sqrt(cells / max_cells)
+        print(f'grid of {int(cells)} cells is over the limit of {max_cells}, resolution set to {resolution}')
+
+    start_x = np.floor(min_x / resolution) * resolution
+    start_y = np.floor(min_y / resolution) * resolution
+    grid_x = np.arange(start_x, max_x, resolution) + resolution / 2
+    grid_y = np.arange(start_y, max_y, resolution) + resolution / 2
+    return grid_x, grid_y
+
+
+def aquifer_grid_mask(aquifer_wkt, grid_x, grid_y):
+    # rasterize the aquifer polygon onto the grid, True for the cells with their center inside the aquifer
+    # returns a (len(grid_x), len(grid_y)) array in the same layout as the kriged fields
+    res_x = grid_x[1] - grid_x[0] if len(grid_x) > 1 else 1
+    res_y = grid_y[1] - grid_y[0] if len(grid_y) > 1 else 1
+    # rasterio rows run from north to south
+    transform = rasterio.transform.from_origin(grid_x[0] - res_x / 2, grid_y[-1] + res_y / 2, res_x, res_y)
+    mask = rasterio.features.geometry_mask([mapping(wkt.loads(aquifer_wkt))], out_shape=(len(grid_y), len(grid_x)),
+                                           transform=transform, invert=True)
+    return mask[::-1].T
+
+
+def get_aquifer_grid_mask(aquifer_id, aquifer_wkt, grid_x, grid_y, cache_dir=None):
+    # aquifer_grid_mask cached on disk per aquifer and grid, the key includes the geometry so an updated
+    # aquifer outline is rasterized again
+    if cache_dir is None:
+        cache_dir = os.path.join(app.get_app_workspace().path, AQUIFER_MASK_DIR)
+    resolution = grid_x[1] - grid_x[0] if len(grid_x) > 1 else 0
+    grid_key = f'{grid_x[0]:.8f},{grid_y[0]:.8f},{len(grid_x)},{len(grid_y)},{resolution:.8f}'
+    key = hashlib.sha1(f'{aquifer_wkt}|{grid_key}'.encode('utf-8')).hexdigest()
+    mask_file = os.path.join(cache_dir, f'aquifer_{aquifer_id}_{resolution:.6f}_{key}.npy')
+    if os.path.exists(mask_file):
+        return np.load(mask_file)
+
+    mask = aquifer_grid_mask(aquifer_wkt, grid_x, grid_y)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_fd, temp_file = tempfile.mkstemp(suffix='.npy', dir=cache_dir)
+    with os.fdopen(temp_fd, 'wb') as f:
+        np.save(f, mask)
+    os.replace(temp_file, mask_file)
+    return mask
+
+
 def krig_field_generate(var_fitted, x_c, y_c, values, grid_x, grid_y):
     # use GSTools to krig  the well data, need coords and value for each well
     # use model variogram paramters generated by GSTools
@@ -315,6 +324,67 @@ def griddata_field_generate(x_c, y_c, values, grid_x, grid_y):
     return rbf_map, mesh_x, mesh_y
 
 
+def idw_field_generate(x_c, y_c, values, grid_x, grid_y, search_radius=None, ndmax=None, power=IDW_POWER,
+                       mask=None, ndmin=1):
+    # inverse distance weighting (Shepard's method) from the ndmax nearest wells within search_radius of each cell
+    # values can hold one column per time step, the neighbors and weights are computed once for all of them
+    # returns the field(s) with the same (x, y) layout as krig_map.field, cells with fewer than ndmin wells in range
+    # are nan, mask optionally limits the interpolation to its True cells, the other cells are nan
+    values = np.asarray(values, dtype=float)
+    single = values.ndim == 1
+    values = values.reshape(len(x_c), -1)
+    well_count = len(x_c)
+    k = well_count if ndmax is None else max(1, min(int(ndmax), well_count))
+    radius = np.inf if search_radius is None else float(search_radius)
+    ndmin = max(1, int(ndmin))
+
+    mesh_x, mesh_y = np.meshgrid(grid_x, grid_y, indexing='ij')
+    if mask is None:
+        cell_ids = np.arange(mesh_x.size)
+    else:
+        cell_ids = np.flatnonzero(np.asarray(mask, dtype=bool).ravel())
+    cells = np.column_stack((mesh_x.ravel()[cell_ids], mesh_y.ravel()[cell_ids]))
+    # every well is a neighbor without an ndmax, the plain distances are cheaper than a sorted KD-tree query
+    all_wells = k == well_count
+    if not all_wells:
+        tree = spatial.cKDTree(np.column_stack((x_c, y_c)))
+    padded_values = np.vstack((values, np.zeros((1, values.shape[1]))))  # index well_count reads zeros
+    fields = np.full((values.shape[1], mesh_x.size), np.nan)
+
+    # the neighbors and weights of a chunk of cells are held at once, cells x k stays under NEIGHBOR_QUERY_SIZE
+    chunk_size = max(1, min(KRIG_CHUNK_SIZE, NEIGHBOR_QUERY_SIZE // k))
+    for start in range(0, len(cells), chunk_size):
+        chunk_ids = cell_ids[start:start + chunk_size]
+        chunk_cells = cells[start:start + chunk_size]
+        if all_wells:
+            dist = np.hypot(chunk_cells[:, 0, np.newaxis] - x_c, chunk_cells[:, 1, np.newaxis] - y_c)
+            in_range = dist <= radius
+        else:
+            dist, index = tree.query(chunk_cells, k=k, distance_upper_bound=radius)
+            dist = np.asarray(dist).reshape(len(chunk_ids), k)
+            index = np.asarray(index).reshape(len(chunk_ids), k)
+            in_range = index < well_count  # wells outside the radius come back with index well_count
+
+        with np.errstate(divide='ignore'):
+            weights = np.where(in_range, 1.0 / dist ** power, 0)
+        # a cell on top of a well takes the well's value, the mean of the wells sharing its position
+        on_well = in_range & (dist == 0)
+        on_well_cells = on_well.any(axis=1)
+        weights[on_well_cells] = on_well[on_well_cells]
+        weights /= np.maximum(weights.sum(axis=1), np.finfo(float).tiny)[:, np.newaxis]
+
+        krigable = in_range.sum(axis=1) >= ndmin
+        if all_wells:
+            fields[:, chunk_ids[krigable]] = weights[krigable].dot(values).T
+        else:
+            for step in range(values.shape[1]):
+                fields[step, chunk_ids[krigable]] = np.sum(weights[krigable] * padded_values[index[krigable], step],
+                                                           axis=1)
+
+    fields = fields.reshape(values.shape[1], len(grid_x), len(grid_y))
+    return fields[0] if single else fields
+
+
 def plot_krig_data(krig_map, measurement, krig_plots, x_c, y_c, values):
     # ---------- Plot a map for review -------------
     # could extract field and use plot_np_data
@@ -398,7 +468,8 @@ def fit_model_var(coords_df, x_c, y_c, values):
     return fit_var
 
 
-def extract_query_objects(region_id, aquifer_id, variable):
+def extract_query_objects(region_id, aquifer_id, variable, start_date=None, end_date=None):
+    # start_date and end_date optionally limit the measurements to a time window, filtered in the database
     session = get_session_obj()
     aquifer_obj = session.query(gf2.ST_AsText(Aquifer.geometry), Aquifer.aquifer_name).filter(
         Aquifer.region_id == region_id,
@@ -409,11 +480,16 @@ def extract_query_objects(region_id, aquifer_id, variable):
     wells_query_df = pd.read_sql(wells_query.statement, session.bind)
     well_ids = [int(well_id) for well_id in wells_query_df.id.values]
     # well_dict = {well.id: well.gse for well in wells_query_df.itertuples()}
-    m_query = session.query(Measurement).filter(Measurement.well_id.in_(well_ids),
-                                                Measurement.variable_id == variable)
+    m_query = session.query(Measurement).filter(Measurement.variable_id == variable,
+                                                Measurement.well_id.in_(well_ids),
+                                                Measurement.ts_datetime.isnot(None))
+    if start_date is not None:
+        m_query = m_query.filter(Measurement.ts_datetime >= start_date)
+    if end_date is not None:
+        m_query = m_query.filter(Measurement.ts_datetime <= end_date)
     measurements_df = pd.read_sql(m_query.statement, session.bind)
     # measurements_df['gse'] = measurements_df['well_id'].map(well_dict)
-    measurements_df['date'] = pd.to_datetime(measurements_df.ts_time, infer_datetime_format=True)
+    measurements_df['date'] = measurements_df.ts_datetime
 
     session.close()
 
@@ -446,11 +522,115 @@ def krig_imputed_wells(years_df, coords_df, values, x_coords, y_coords, grid_x,
     krig_plots.close()
 
 
-def generate_nc_file(file_name, grid_x, grid_y, years_df, coords_df, x_coords, y_coords):
+def parallel_imap(func, items, workers=1):
+    # Apply func to each item across a pool of threads, yielding results in the order of items.
+    # The interpolation runs inside daemonic dask worker processes, which may not start child processes.
+    # Threads still run in parallel where the time is spent in numpy/scipy linear algebra, which releases the GIL,
+    # the python parts of variogram fitting run one thread at a time.
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        yield from executor.map(func, items)
+
+
+def variogram_fit_steps(years_df, policy=VARIOGRAM_EVERY, refit_every=VARIOGRAM_REFIT_EVERY,
+                        variance_shift=VARIOGRAM_VARIANCE_SHIFT):
+    # flag the time steps that fit a new variogram, the other steps reuse the variogram of the last fitted step
+    # every: fit every step, once: fit the first step only, every_n: fit every refit_every steps,
+    # variance: refit when the variance of the values moves more than variance_shift (relative) from the last fit
+    fit_steps = []
+    fitted_variance = None
+    for step, measurement in enumerate(years_df):
+        if policy == VARIOGRAM_ONCE:
+            fit = step == 0
+        elif policy == VARIOGRAM_EVERY_N:
+            fit = step % max(1, int(refit_every)) == 0
+        elif policy == VARIOGRAM_VARIANCE:
+            variance = np.var(years_df[measurement].values)
+            fit = bool(fitted_variance is None or
+                       abs(variance - fitted_variance) > variance_shift * abs(fitted_variance))
+            if fit:
+                fitted_variance = variance
+        else:
+            fit = True
+        fit_steps.append(fit)
+    return fit_steps
+
+
+def krig_time_step(step_args):
+    # krig a single time step in a worker thread
+    # var_fitted is None when the step fits its own variogram, neighborhood limits the wells used per cell
+    # mask limits the kriging to the cells inside the aquifer
+    values, coords_df, x_coords, y_coords, grid_x, grid_y, var_fitted, neighborhood, mask = step_args
+    fit_time = 0
+    if var_fitted is None:
+        beg_time = timer()
+        # fit the model variogram to the experimental variogram
+        var_fitted = fit_model_var(coords_df, x_coords, y_coords, values)  # fit variogram
+        fit_time = timer() - beg_time
+    beg_time = timer()
+    if neighborhood is not None or mask is not None:
+        krig_system = make_kriging_system(var_fitted, x_coords, y_coords, grid_x, grid_y, neighborhood, mask)
+        field = krig_system.krige(values)
+    else:
+        krig_map = krig_field_generate(var_fitted, x_coords, y_coords, values, grid_x, grid_y)  # krig data
+        # krig_map.field provides the 2D array of values
+        field = krig_map.field
+    end_time = timer()
+    return field, fit_time, end_time - beg_time
+
+
+def krig_segment(segment_args):
+    # krig several time steps sharing one variogram, the kriging system is factorized once for all of them
+    var_fitted, x_coords, y_coords, grid_x, grid_y, values, neighborhood, mask = segment_args
+    beg_time = timer()
+    krig_system = make_kriging_system(var_fitted, x_coords, y_coords, grid_x, grid_y, neighborhood, mask)
+    fields = krig_system.krige(values)
+    krig_time = (timer() - beg_time) / len(fields)
+    return [(field, 0, krig_time) for field in fields]
+
+
+def nc_value_encoding(encoding, values):
+    # data type, fill value, attributes and value range of tsvalue for an output encoding
+    # float64: full precision, float32: half the size, packed: 16 bit integers with scale_factor and add_offset
+    # covering the range of the well values plus a margin for over/undershoot of the interpolation
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if encoding == NC_PACKED and not len(values):
+        # no well values to size the packed range from, e.g. an aquifer without imputed wells
+        print('No well values to size the packed tsvalue range, writing float32 instead')
+        encoding = NC_FLOAT32
+    if encoding == NC_PACKED:
+        low, high = values.min(), values.max()
+        margin = max(high - low, 1) * NC_PACKED_MARGIN
+        low, high = low - margin, high + margin
+        attributes = {'scale_factor': (high - low) / (2 ** 16 - 2),  # -32768 is kept for the fill value
+                      'add_offset': (high + low) / 2}
+        return np.int16, np.iinfo(np.int16).min, attributes, (low, high)
+    if encoding == NC_FLOAT64:
+        return np.float64, -9999, {}, None
+    return np.float32, -9999, {}, None
+
+
+def generate_nc_file(file_path, grid_x, grid_y, years_df, coords_df, x_coords, y_coords, progress_callback=None,
+                     workers=1, variogram_policy=VARIOGRAM_EVERY, refit_every=VARIOGRAM_REFIT_EVERY,
+                     variance_shift=VARIOGRAM_VARIANCE_SHIFT, neighborhood=None, spatial_interpolation=None,
+                     mask=None, encoding=NC_FLOAT32):
+    # progress_callback is optionally called with the number of finished and total time steps after each step
+    # time steps are kriged across worker threads, results are written in time order as they arrive
+    # variogram_policy decides which time steps fit a new variogram, see variogram_fit_steps
+    # neighborhood optionally limits the wells kriged per cell, see kriging.NeighborhoodKrigingSystem
+    # spatial_interpolation IDW replaces kriging with inverse distance weighting over the same neighborhood
+    # mask optionally limits the interpolation to the grid cells inside the aquifer, the others are left empty
+    # the file is written in one pass next to file_path and renamed when complete, so THREDDS never serves
+    # a partial file. tsvalue uses the CF (time, lat, lon) dimension order, encoding is one of NC_ENCODINGS
     print('generating netcdf file')
-    temp_dir = tempfile.mkdtemp()
-    file_path = os.path.join(temp_dir, file_name)
-    h = netCDF4.Dataset(file_path, 'w', format="NETCDF4")
+    temp_path = f'{file_path}.part'
+    h = netCDF4.Dataset(temp_path, 'w', format="NETCDF4")
     lat_len = len(grid_y)
     lon_len = len(grid_x)
     time = h.createDimension("time", 0)
@@ -459,7 +639,11 @@ def generate_nc_file(file_name, grid_x, grid_y, years_df, coords_df, x_coords, y
     latitude = h.createVariable("lat", np.float64, ("lat"))
     longitude = h.createVariable("lon", np.float64, ("lon"))
     time = h.createVariable("time", np.float64, ("time"), fill_value="NaN")
-    ts_value = h.createVariable("tsvalue", np.float64, ('time', 'lon', 'lat'), fill_value=-9999)
+    # compressed and chunked by time step, each step is one chunk
+    datatype, fill_value, attributes, value_range = nc_value_encoding(encoding, years_df.values)
+    ts_value = h.createVariable("tsvalue", datatype, ('time', 'lat', 'lon'), fill_value=fill_value,
+                                zlib=True, shuffle=True, complevel=NC_COMPLEVEL, chunksizes=(1, lat_len, lon_len))
+    ts_value.setncatts(attributes)
     latitude.long_name = "Latitude"
     latitude.units = "degrees_north"
     latitude.axis = "Y"
@@ -468,57 +652,100 @@ def generate_nc_file(file_name, grid_x, grid_y, years_df, coords_df, x_coords, y
     longitude.axis = "X"
     time.axis = "T"
     time.units = 'days since 0001-01-01 00:00:00 UTC'
+    # the CRS in the layout rioxarray writes, so the file can be opened as a georeferenced raster
+    spatial_ref = h.createVariable("spatial_ref", np.int32)
+    spatial_ref.crs_wkt = NC_CRS_WKT
+    spatial_ref.spatial_ref = NC_CRS_WKT
+    spatial_ref.grid_mapping_name = 'latitude_longitude'
+    spatial_ref.semi_major_axis = 6378137.0
+    spatial_ref.inverse_flattening = 298.257223563
+    ts_value.grid_mapping = 'spatial_ref'
 
     latitude[:] = grid_y[:]
     longitude[:] = grid_x[:]
 
-    time_counter = 0
-    for measurement in years_df:
-        # loop through the data
-        values = years_df[measurement].values
+    fit_steps = []
+    fit_times = []
+    if spatial_interpolation == IDW:
+        # no variogram, all time steps are weighted at once
+        beg_time = timer()
+        neighborhood = neighborhood or {}
+        fields = idw_field_generate(x_coords, y_coords, years_df.values, grid_x, grid_y,
+                                    neighborhood.get('search_radius'), neighborhood.get('ndmax'), mask=mask,
+                                    ndmin=neighborhood.get('ndmin', 1))
+        idw_time = (timer() - beg_time) / max(1, len(fields))
+        krig_steps = ((field, 0, idw_time) for field in fields)
+    elif variogram_policy == VARIOGRAM_EVERY:
+        fit_steps = variogram_fit_steps(years_df, variogram_policy)
+        # every step fits its own variogram in the worker threads
+        step_args = [(years_df[measurement].values, coords_df, x_coords, y_coords, grid_x, grid_y, None,
+                      neighborhood, mask) for measurement in years_df]
+        krig_steps = parallel_imap(krig_time_step, step_args, workers)
+    else:
+        # consecutive steps sharing a variogram are kriged together with one precomputed kriging system
+        fit_steps = variogram_fit_steps(years_df, variogram_policy, refit_every, variance_shift)
+        segment_args = []
+        for step, (measurement, fit) in enumerate(zip(years_df, fit_steps)):
+            fit_time = 0
+            if fit:
+                beg_time = timer()
+                var_fitted = fit_model_var(coords_df, x_coords, y_coords, years_df[measurement].values)
+                fit_time = timer() - beg_time
+                segment_args.append([var_fitted, x_coords, y_coords, grid_x, grid_y, []])
+            fit_times.append(fit_time)
+            segment_args[-1][-1].append(step)
+        segment_args = [(var_fitted, x_c, y_c, g_x, g_y, years_df.iloc[:, steps].values, neighborhood, mask)
+                        for var_fitted, x_c, y_c, g_x, g_y, steps in segment_args]
+        krig_steps = itertools.chain.from_iterable(parallel_imap(krig_segment, segment_args, workers))
 
-        beg_time = timer()  # time the kriging method including variogram fitting
-        # fit the model variogram to the experimental variogram
-        var_fitted = fit_model_var(coords_df, x_coords, y_coords, values)  # fit variogram
-        krig_map = krig_field_generate(var_fitted, x_coords, y_coords, values, grid_x, grid_y)  # krig data
-        # krig_map.field provides the 2D array of values
-        end_time = timer()
-        print('krig time = ', end_time - beg_time)
+    time_counter = 0
+    total_fit_time = 0
+    for measurement, (field, fit_time, krig_time) in zip(years_df, krig_steps):
+        if fit_times:
+            fit_time = fit_times[time_counter]
+        total_fit_time += fit_time
+        print('variogram fit time = ', fit_time, ' interpolation time = ', krig_time)
         time[time_counter] = measurement.toordinal()
-        ts_value[time_counter, :, :] = krig_map.field
+        empty = np.isnan(field)
+        if value_range is not None:
+            # keep packed values inside the 16 bit range, empty cells hold a packable value under the mask
+            field = np.where(empty, np.mean(value_range), np.clip(field, *value_range))
+        # fields are (lon, lat), empty cells are stored as the fill value
+        ts_value[time_counter, :, :] = np.ma.masked_array(field.T, mask=empty.T)
         time_counter += 1
+        if progress_callback is not None:
+            progress_callback(time_counter, len(years_df.columns))
 
     h.close()
+    os.replace(temp_path, file_path)
+    print(f'variogram fits: {sum(fit_steps)} of {len(fit_steps)} time steps, total fit time {total_fit_time}')
     print(file_path)
     return Path(file_path)
 
 
-def clip_nc_file(file_path, aquifer_obj, region_id):
+def get_output_path(aquifer_obj, region_id, file_name):
+    # interpolation files are written straight to the aquifer directory of the THREDDS server
     thredds_directory = app.get_custom_setting('gw_thredds_directoy')
     aquifer_name = aquifer_obj[1].replace(" ", "_")
     aquifer_dir = os.path.join(thredds_directory, str(region_id), str(aquifer_name))
     if not os.path.exists(aquifer_dir):
         os.makedirs(aquifer_dir)
 
-    output_file = os.path.join(aquifer_dir, file_path.name)
-    temp_dir = file_path.parent.absolute()
-    interp_nc = xarray.open_dataset(file_path)
-    interp_nc.rio.set_spatial_dims(x_dim="lon", y_dim="lat", inplace=True)
-    interp_nc.rio.write_crs("epsg:4326", inplace=True)
+    return os.path.join(aquifer_dir, file_name)
 
-    aquifer_geom = wkt.loads(aquifer_obj[0])
-    aquifer_gdf = gpd.GeoDataFrame({'name': ['random'], 'geometry': [aquifer_geom]})
-    # aq_geom_str = json.dumps(mapping(aquifer_geom[0]))
-    # print(type(aq_geom_str))
-    # cropping_geometries = [geojson.loads(aq_geom_str)]
-    clipped_nc = interp_nc.rio.clip(aquifer_gdf.geometry.apply(mapping), crs=4326, drop=True)
-    clipped_nc.to_netcdf(output_file)
-    shutil.rmtree(temp_dir)
 
-    return output_file
+def crop_to_mask(grid_x, grid_y, mask):
+    # drop the rows and columns of the grid without a cell inside the aquifer
+    inside_x = np.flatnonzero(mask.any(axis=1))
+    inside_y = np.flatnonzero(mask.any(axis=0))
+    if not len(inside_x):
+        return grid_x, grid_y, mask
+    x_window = slice(inside_x[0], inside_x[-1] + 1)
+    y_window = slice(inside_y[0], inside_y[-1] + 1)
+    return grid_x[x_window], grid_y[y_window], mask[x_window, y_window]
 
 
-def mlr_interpolation(mlr_dict):
+def mlr_interpolation(mlr_dict, progress_callback=None):
     region_id = mlr_dict['region']
     aquifer_id = mlr_dict['aquifer']
     variable = mlr_dict['variable']
@@ -530,10 +757,10 @@ def mlr_interpolation(mlr_dict):
     start_date = datetime.datetime(mlr_dict['start_date'], 1, 1)
     end_date = datetime.datetime(mlr_dict['end_date'], 1, 1)
 
+    # the imputation is trained on the full measurement history of the wells, the requested window only selects
+    # the output time steps. Limiting the query to the window would drop wells and change the imputed values
     bbox, wells_query_df, measurements_df, aquifer_obj = extract_query_objects(region_id, aquifer_id, variable)
-    pdsi_df = get_thredds_value(SERVER1, LAYER1, bbox)  # pdsi values
-    soilw_df = get_thredds_value(SERVER2, LAYER2, bbox)  # soilw values
-    gldas_df = pd.concat([pdsi_df, soilw_df], join="outer", axis=1)
+    gldas_df = get_covariates(bbox)  # pdsi and soilw values
     gldas_df = sat_resample(gldas_df)
     gldas_df, names = sat_rolling_window(YEARS, gldas_df)
     print('gldas', gldas_df)
@@ -555,7 +782,8 @@ def mlr_interpolation(mlr_dict):
     print('combined_df', combined_df)
     norm_df = norm_training_data(combined_df, combined_df)
     print('norm_df', norm_df)
-    imputed_norm_df = impute_data(norm_df, well_names, names)
+    imputed_norm_df = impute_data(norm_df, well_names, names,
+                                  mlr_dict.get('hidden_units', HIDDEN_UNITS), mlr_dict.get('lamb_value', LAMB_VALUE))
     ref_df = combined_df[well_names]
     imputed_df = renorm_data(imputed_norm_df, ref_df)
     # print(imputed_df)
@@ -568,49 +796,72 @@ def mlr_interpolation(mlr_dict):
     y_coords = coords_df.latitude.values
 
     # create grid
-    x_steps = 400  # steps in x-direction, number of y-steps will be computed with same spacing, adds 10%
-    grid_x, grid_y = create_grid_coords(x_coords, y_coords, x_steps)  # coordinates for x and y axis - not full grid
-
-    skip_month = 48  # take data every nth month (skip_months), e.g., 60 = every 5 years
-    years_df = imputed_df.iloc[::skip_month].T  # extract every nth month of data and transpose array
-    print(len(years_df))
+    if mlr_dict.get('resolution'):
+        # cells of the requested resolution covering the aquifer bbox
+        grid_x, grid_y = create_resolution_grid(bbox, mlr_dict['resolution'])
+    else:
+        x_steps = 400  # steps in x-direction, number of y-steps will be computed with same spacing, adds 10%
+        grid_x, grid_y = create_grid_coords(x_coords, y_coords, x_steps)  # coordinates for x and y axis
+    print('grid size', len(grid_x), len(grid_y))
+    # only the cells inside the aquifer are interpolated
+    mask = get_aquifer_grid_mask(aquifer_id, aquifer_obj[0], grid_x, grid_y)
+    grid_x, grid_y, mask = crop_to_mask(grid_x, grid_y, mask)
+    print('cells inside the aquifer', int(mask.sum()))
+
+    # output time steps from the requested window and frequency, taken from the imputed data nearest to each step
+    output_times = pd.date_range(start=start_date, end=end_date, freq=mlr_dict.get('resample_rate', '1YS'))
+    window_df = imputed_df.sort_index().loc[start_date - OUTPUT_TIME_TOLERANCE:end_date + OUTPUT_TIME_TOLERANCE]
+    years_df = window_df.reindex(output_times, method='nearest', tolerance=OUTPUT_TIME_TOLERANCE)
+    missing_times = years_df.index[years_df.isna().all(axis=1)]
+    if len(missing_times):
+        print('no imputed data for time steps', list(missing_times))
+    years_df = years_df.dropna(how='all').T  # one column per time step
+    print(len(years_df.columns), 'time steps')
     aquifer_name = aquifer_obj[1].replace(" ", "_")
     file_name = f'{aquifer_name}_{variable}_{time.time()}.nc'
     # setup a netcdf file to store the time series of rasters
     #
-    nc_file_path = generate_nc_file(file_name, grid_x, grid_y, years_df, coords_df, x_coords, y_coords)
-    final_nc_path = clip_nc_file(nc_file_path, aquifer_obj, region_id)
+    nc_file_path = get_output_path(aquifer_obj, region_id, file_name)
+    final_nc_path = generate_nc_file(nc_file_path, grid_x, grid_y, years_df, coords_df, x_coords, y_coords,
+                                     progress_callback, mlr_dict.get('time_workers', 1),
+                                     mlr_dict.get('variogram_policy', VARIOGRAM_EVERY),
+                                     mlr_dict.get('variogram_refit_every', VARIOGRAM_REFIT_EVERY),
+                                     mlr_dict.get('variogram_variance_shift', VARIOGRAM_VARIANCE_SHIFT),
+                                     mlr_dict.get('neighborhood'), mlr_dict.get('spatial_interpolation'), mask,
+                                     mlr_dict.get('nc_encoding', NC_FLOAT32))
     return final_nc_path
 
 
-def process_interpolation(info_dict):
-    print(info_dict)
-    from_wizard = info_dict['from_wizard']
-    if from_wizard == 'true':
-        pass
-    else:
-        pass
+def interpolation_progress(progress_id, aquifer_index, aquifer_count):
+    # Returns a callback that records the time step progress of one aquifer in the job status table
+    def progress_callback(step, total_steps):
+        update_job_status(progress_id,
+                          status='running',
+                          message=f'Aquifer {aquifer_index + 1} of {aquifer_count}: '
+                                  f'time step {step} of {total_steps}')
+    return progress_callback
+
+
+def get_aquifer_workers(info_dict):
+    # aquifers of a region interpolated at the same time: the aquifer_workers of the request, else the
+    # aquifer_workers app setting, else AQUIFER_WORKERS
+    aquifer_workers = info_dict.get('aquifer_workers') or app.get_custom_setting('aquifer_workers')
+    return max(1, int(aquifer_workers or AQUIFER_WORKERS))
 
+
+def build_mlr_dicts(info_dict):
+    # Translate the interpolation request into one mlr_dict per aquifer to interpolate
     start_date = int(info_dict['start_date'])
     end_date = int(info_dict['end_date'])
-    interval = int(info_dict['frequency'])
-    iterations = (end_date - start_date) / (interval + 1)
+    interval = float(info_dict['frequency'])  # years between output time steps, .25 and .5 for 3 and 6 months
     start_time = calendar.timegm(datetime.datetime(start_date, 1, 1).timetuple())
     end_time = calendar.timegm(datetime.datetime(end_date, 1, 1).timetuple())
 
-    time_u = "Y"
-
-    if interval <= .5:
-        time_u = "M"
-        time_v = 6
-        iterations += 1
-        if interval == .25:
-            iterations += 2
-            time_v = 3
+    # pandas frequency of the output time steps, anchored at the start of the month or year
+    if interval < 1:
+        resample_rate = f'{max(1, int(round(interval * 12)))}MS'
     else:
-        time_v = int(interval)
-
-    resample_rate = f'{time_v}{time_u}'
+        resample_rate = f'{int(interval)}YS'
 
     temporal_interpolation = info_dict['temporal_interpolation']
     min_samples = int(info_dict['min_samples'])
@@ -628,9 +879,33 @@ def process_interpolation(info_dict):
     gap_size = info_dict['gap_size']
     pad = int(info_dict['pad'])
     spacing = info_dict['spacing']
-
+    hidden_units = int(info_dict.get('hidden_units') or HIDDEN_UNITS)
+    lamb_value = float(info_dict.get('lamb_value') or LAMB_VALUE)
+    spatial_interpolation = info_dict.get('spatial_interpolation')
+    nc_encoding = info_dict.get('nc_encoding') or NC_FLOAT32
+    if nc_encoding not in NC_ENCODINGS:
+        raise ValueError(f'nc_encoding must be one of {", ".join(NC_ENCODINGS)}')
+    resolution = float(info_dict['resolution']) if info_dict.get('resolution') else None
+    variogram_policy = info_dict.get('variogram_policy') or VARIOGRAM_EVERY
+    # a local neighborhood krigs each cell from the wells within search_radius, between ndmin and ndmax of them
+    # (999 is no maximum), the global default uses every well
+    neighborhood = None
+    if info_dict.get('neighborhood') == NEIGHBORHOOD_LOCAL:
+        ndmax = int(info_dict.get('ndmax') or NO_MAXIMUM)
+        neighborhood = {'search_radius': float(info_dict['search_radius']) if info_dict.get('search_radius') else None,
+                        'ndmin': int(info_dict.get('ndmin') or 1),
+                        'ndmax': None if ndmax >= NO_MAXIMUM else ndmax}
+    variogram_refit_every = int(info_dict.get('variogram_refit_every') or VARIOGRAM_REFIT_EVERY)
+    variogram_variance_shift = float(info_dict.get('variogram_variance_shift') or VARIOGRAM_VARIANCE_SHIFT)
+
+    # share the cores between the aquifers running at the same time and the time steps within each aquifer
+    aquifer_workers = get_aquifer_workers(info_dict)
+    default_time_workers = max(1, (os.cpu_count() or 1) // max(1, min(aquifer_workers, len(aquifer_list))))
+    time_workers = int(info_dict.get('time_workers', default_time_workers))
+
+    mlr_dicts = []
     if temporal_interpolation == 'MLR':
-        for aquifer in aquifer_list:
+        for aquifer_index, aquifer in enumerate(aquifer_list):
             mlr_dict = {'region': region_id,
                         'aquifer': aquifer,
                         'min_samples': min_samples,
@@ -644,11 +919,65 @@ def process_interpolation(info_dict):
                         'resample_rate': resample_rate,
                         'gap_size': gap_size,
                         'pad': pad,
-                        'spacing': spacing}
-            mlr_interpolation(mlr_dict)
-
-    end_time = time.time()
-    total_time = end_time - start_time
-    return total_time
-
-# process_interpolation(INFO_DICT)
+                        'spacing': spacing,
+                        'hidden_units': hidden_units,
+                        'lamb_value': lamb_value,
+                        'spatial_interpolation': spatial_interpolation,
+                        'nc_encoding': nc_encoding,
+                        'resolution': resolution,
+                        'variogram_policy': variogram_policy,
+                        'neighborhood': neighborhood,
+                        'variogram_refit_every': variogram_refit_every,
+                        'variogram_variance_shift': variogram_variance_shift,
+                        'time_workers': time_workers,
+                        'progress_id': info_dict.get('progress_id'),
+                        'aquifer_index': aquifer_index,
+                        'aquifer_count': len(aquifer_list)}
+            mlr_dicts.append(mlr_dict)
+
+    return mlr_dicts
+
+
+def run_aquifer_interpolation(mlr_dict):
+    # Interpolate one aquifer, returning its output path, run time and error instead of raising,
+    # so a failing aquifer does not stop the others. start and end are wall clock times taken inside the task,
+    # so the run time of a region excludes the time its tasks waited for a dask worker
+    start = time.time()
+    beg_time = timer()
+    progress_id = mlr_dict.get('progress_id')
+    progress_callback = None
+    if progress_id is not None:
+        progress_callback = interpolation_progress(progress_id, mlr_dict['aquifer_index'], mlr_dict['aquifer_count'])
+
+    result = {'aquifer': mlr_dict['aquifer'], 'file': None, 'error': None}
+    try:
+        result['file'] = str(mlr_interpolation(mlr_dict, progress_callback))
+    except Exception as e:
+        result['error'] = str(e)
+    result['time'] = timer() - beg_time
+    result['start'] = start
+    result['end'] = time.time()
+
+    if progress_id is not None:
+        # progress counts finished aquifers, increment in the database as aquifers may finish in parallel
+        status = {'progress': JobStatus.progress + 1}
+        if result['error'] is not None:
+            status['message'] = f'Aquifer {mlr_dict["aquifer"]} failed: {result["error"]}'
+        update_job_status(progress_id, **status)
+    return result
+
+
+def collect_interpolation_results(info_dict, results):
+    # Combine the per aquifer results of an interpolation run into one result
+    failures = [result for result in results if result['error'] is not None]
+    total_time = max(result['end'] for result in results) - min(result['start'] for result in results) if results else 0
+    progress_id = info_dict.get('progress_id')
+    if progress_id is not None:
+        update_job_status(progress_id,
+                          status='error' if failures else 'complete',
+                          message=f'Interpolated {len(results) - len(failures)} of {len(results)} aquifer(s)',
+                          result=results)
+
+    return {'total_time': total_time,
+            'aquifers': results,
+            'failures': len(failures)}
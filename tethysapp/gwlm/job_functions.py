@@ -1,8 +1,19 @@
+import os
+import shutil
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
 import dask
 import requests
-from .interpolation_utils import process_interpolation
+from .interpolation_utils import (build_mlr_dicts,
+                                  collect_interpolation_results,
+                                  get_aquifer_workers,
+                                  run_aquifer_interpolation)
+from .utils import (create_job_status,
+                    update_job_status)
 
-# from .interpolation_utils import process_interpolation
+UPLOAD_WORKERS = 2  # uploads processed at the same time, each holds a database connection
+UPLOAD_EXECUTOR = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
 
 INFO_DICT = {'region': '3',
              'aquifer': '24',
@@ -10,6 +21,7 @@ INFO_DICT = {'region': '3',
              'porosity': '0.1',
              'spatial_interpolation': 'IDW',
              'temporal_interpolation': 'MLR',
+             'neighborhood': 'local',
              'search_radius': '0.1',
              'ndmin': '5',
              'ndmax': '15',
@@ -28,11 +40,97 @@ INFO_DICT = {'region': '3',
              'spacing': '1MS'}
 
 
-def dask_interp(info_dict):
-    result = process_interpolation(info_dict)
-    return result
+def dask_collect(info_dict, lanes):
+    # lane i of n ran the aquifers i, i + n, i + 2n, ..., put the results back in aquifer order
+    results = [result for _, result in sorted(((lane_index + position * len(lanes), result)
+                                               for lane_index, lane in enumerate(lanes)
+                                               for position, result in enumerate(lane)),
+                                              key=lambda indexed: indexed[0])]
+    try:
+        return collect_interpolation_results(info_dict, results)
+    except Exception as e:
+        record_interpolation_error(info_dict.get('progress_id'), f'Interpolation failed: {e}')
+        raise
+
+
+def dask_aquifer_lane(mlr_dicts):
+    # Interpolate aquifers one after the other, delayed_job runs aquifer_workers lanes at the same time
+    return [dask_aquifer(mlr_dict) for mlr_dict in mlr_dicts]
+
+
+def dask_aquifer(mlr_dict):
+    # Interpolate one aquifer. run_aquifer_interpolation reports interpolation errors in its result, anything
+    # raised outside of it (e.g. a failing progress update) is written to the job status before the task fails,
+    # so the jobs table does not keep showing the last time step
+    try:
+        return run_aquifer_interpolation(mlr_dict)
+    except Exception as e:
+        record_interpolation_error(mlr_dict.get('progress_id'), f'Aquifer {mlr_dict["aquifer"]} failed: {e}')
+        raise
+
+
+def record_interpolation_error(progress_id, message):
+    if progress_id is None:
+        return
+    try:
+        update_job_status(progress_id, status='error', message=message)
+    except Exception as e:
+        print(f'Could not record the interpolation error "{message}": {e!r}')
 
 
 # Delayed Job
 def delayed_job(info_dict):
-    return dask.delayed(dask_interp(info_dict), pure=False)
+    # The aquifers of a region are dealt round robin to at most aquifer_workers lanes (see get_aquifer_workers),
+    # dask runs the lanes in parallel across its workers and the aquifers of a lane one after the other
+    mlr_dicts = build_mlr_dicts(info_dict)
+    lane_count = max(1, min(get_aquifer_workers(info_dict), len(mlr_dicts)))
+    lane_tasks = [dask.delayed(dask_aquifer_lane, pure=False)(mlr_dicts[lane_index::lane_count])
+                  for lane_index in range(lane_count)]
+    return dask.delayed(dask_collect, pure=False)(info_dict, lane_tasks)
+
+
+def run_upload_job(job_id, upload_function, kwargs, upload_dir=None):
+    # Run an upload processing function, recording progress and the final response in the job status table.
+    # upload_dir holds the saved upload files and is removed once the job ends, whether it succeeded or not
+    try:
+        update_job_status(job_id, status='running')
+
+        def progress_callback(rows_processed):
+            update_job_status(job_id, progress=rows_processed)
+
+        try:
+            result = upload_function(progress_callback=progress_callback, **kwargs)
+        except Exception as e:
+            result = {'error': str(e)}
+
+        status = 'error' if 'error' in result else 'complete'
+        update_job_status(job_id, status=status, result=result)
+        return result
+    finally:
+        if upload_dir is not None and os.path.exists(upload_dir):
+            shutil.rmtree(upload_dir)
+
+
+def upload_job_done(job_id):
+    # Returns a future callback reporting upload jobs that failed outside the processing function, e.g. while
+    # writing their status, which the executor would otherwise swallow
+    def done_callback(future):
+        error = future.exception()
+        if error is None:
+            return
+        print(f'Upload job {job_id} failed: {error!r}')
+        traceback.print_exception(type(error), error, error.__traceback__)
+        try:
+            update_job_status(job_id, status='error', result={'error': str(error)})
+        except Exception as e:
+            print(f'Could not record the failure of upload job {job_id}: {e!r}')
+    return done_callback
+
+
+def submit_upload_job(job_type, upload_function, upload_dir=None, **kwargs):
+    # Queue an upload on the background executor and return the job id used to poll its progress.
+    # Uploaded files must already be saved to upload_dir, the request is gone by the time the job runs.
+    job_id = create_job_status(job_type)
+    future = UPLOAD_EXECUTOR.submit(run_upload_job, job_id, upload_function, kwargs, upload_dir)
+    future.add_done_callback(upload_job_done(job_id))
+    return job_id
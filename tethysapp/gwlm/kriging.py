@@ -0,0 +1,225 @@
+import warnings
+
+import numpy as np
+from scipy import linalg, spatial
+
+KRIG_CHUNK_SIZE = 20000  # grid cells solved at a time, bounds the memory of the grid-to-well weights
+NEIGHBOR_QUERY_SIZE = 2000000  # neighbor indexes (cells x ndmax) held at once while searching the wells of the grid
+KRIG_MIN_RCOND = 1e-10  # kriging matrices with a smaller reciprocal condition number are solved with the pseudo inverse
+
+
+class OrdinaryKrigingSystem:
+    """
+    Ordinary kriging system for fixed well positions, grid and variogram model. The well-to-well covariance
+    matrix is factorized once and the grid-to-well weights are computed once per grid chunk, so kriging any
+    number of time slices costs one matrix product per chunk.
+    """
+    def __init__(self, model, x_c, y_c, grid_x, grid_y, chunk_size=KRIG_CHUNK_SIZE, mask=None):
+        """
+        Args:
+            model: Fitted gstools covariance model
+            x_c: Well x coordinates
+            y_c: Well y coordinates
+            grid_x: Grid x axis
+            grid_y: Grid y axis
+            chunk_size: Grid cells solved at a time
+            mask: Optional boolean array of shape (len(grid_x), len(grid_y)), only True cells are kriged
+        """
+        self.model = model
+        self.x_c = np.asarray(x_c, dtype=float)
+        self.y_c = np.asarray(y_c, dtype=float)
+        self.grid_x = np.asarray(grid_x, dtype=float)
+        self.grid_y = np.asarray(grid_y, dtype=float)
+        self.chunk_size = chunk_size
+        self.mask = mask
+        self._factor = None
+        self._inverse = None
+        self._factorize()
+
+    def grid_cells(self):
+        """
+        Flat indexes and coordinates of the grid cells to krig
+
+        Returns:
+            Tuple of the flat cell indexes and an array of their (x, y) coordinates
+        """
+        mesh_x, mesh_y = np.meshgrid(self.grid_x, self.grid_y, indexing='ij')
+        if self.mask is None:
+            cell_ids = np.arange(mesh_x.size)
+        else:
+            cell_ids = np.flatnonzero(np.asarray(self.mask, dtype=bool).ravel())
+        return cell_ids, np.column_stack((mesh_x.ravel()[cell_ids], mesh_y.ravel()[cell_ids]))
+
+    def _well_covariance(self, x, y):
+        dist = np.hypot(x[:, np.newaxis] - self.x_c[np.newaxis, :], y[:, np.newaxis] - self.y_c[np.newaxis, :])
+        return self.model.cov_nugget(dist)
+
+    def _factorize(self):
+        # covariance between the wells bordered by the unbiasedness condition (weights sum up to 1)
+        cond_no = len(self.x_c)
+        krige_mat = np.zeros((cond_no + 1, cond_no + 1))
+        krige_mat[:cond_no, :cond_no] = self._well_covariance(self.x_c, self.y_c)
+        krige_mat[cond_no, :cond_no] = 1
+        krige_mat[:cond_no, cond_no] = 1
+        with warnings.catch_warnings():
+            # a singular matrix is handled below
+            warnings.simplefilter('ignore', linalg.LinAlgWarning)
+            lu, piv = linalg.lu_factor(krige_mat, check_finite=False)
+            gecon = linalg.get_lapack_funcs('gecon', (lu,))
+            rcond, _ = gecon(lu, np.linalg.norm(krige_mat, 1), norm='1')
+        if not rcond >= KRIG_MIN_RCOND:
+            # wells at (nearly) the same position make the system (nearly) singular, the LU solve would amplify
+            # rounding errors into huge weights, use the pseudo inverse like gstools does
+            self._inverse = linalg.pinv(krige_mat)
+        else:
+            self._factor = (lu, piv)
+
+    def _solve(self, rhs):
+        if self._factor is not None:
+            return linalg.lu_solve(self._factor, rhs, check_finite=False)
+        return self._inverse.dot(rhs)
+
+    def chunk_weights(self, x, y):
+        """
+        Kriging weights of the wells for a set of target points
+
+        Args:
+            x: Target x coordinates
+            y: Target y coordinates
+
+        Returns:
+            Array of shape (number of targets, number of wells)
+        """
+        rhs = np.ones((len(self.x_c) + 1, len(x)))
+        rhs[:-1, :] = self._well_covariance(x, y).T
+        return self._solve(rhs)[:-1, :].T
+
+    def krige(self, values):
+        """
+        Krig one or more time slices on the structured grid, cells outside the mask are NaN
+
+        Args:
+            values: Well values, shape (number of wells,) or (number of wells, number of slices)
+
+        Returns:
+            Fields of shape (len(grid_x), len(grid_y)), with a leading slice axis if values is 2D
+        """
+        values = np.asarray(values, dtype=float)
+        single = values.ndim == 1
+        values = values.reshape(len(self.x_c), -1)
+
+        cell_ids, cells = self.grid_cells()
+        fields = np.full((len(self.grid_x) * len(self.grid_y), values.shape[1]), np.nan)
+        for start in range(0, len(cell_ids), self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            fields[cell_ids[chunk]] = self.chunk_weights(cells[chunk, 0], cells[chunk, 1]).dot(values)
+
+        fields = fields.T.reshape(values.shape[1], len(self.grid_x), len(self.grid_y))
+        return fields[0] if single else fields
+
+
+class NeighborhoodKrigingSystem(OrdinaryKrigingSystem):
+    """
+    Ordinary kriging with a moving neighborhood. Each grid cell is kriged from at most ndmax wells within
+    search_radius, cells with fewer than ndmin wells in range are left empty. Cells sharing the same set of
+    neighbors share one factorized kriging system, their weights are computed a chunk at a time when kriging.
+    """
+    def __init__(self, model, x_c, y_c, grid_x, grid_y, search_radius=None, ndmin=1, ndmax=None,
+                 chunk_size=KRIG_CHUNK_SIZE, mask=None):
+        """
+        Args:
+            model: Fitted gstools covariance model
+            x_c: Well x coordinates
+            y_c: Well y coordinates
+            grid_x: Grid x axis
+            grid_y: Grid y axis
+            search_radius: Largest distance of a well used for a cell, None for no limit
+            ndmin: Fewest wells needed to krig a cell
+            ndmax: Most wells used for a cell, None for no limit
+            chunk_size: Grid cells searched and solved at a time
+            mask: Optional boolean array of shape (len(grid_x), len(grid_y)), only True cells are kriged
+        """
+        self.search_radius = np.inf if search_radius is None else float(search_radius)
+        self.ndmin = max(1, int(ndmin))
+        self.ndmax = len(x_c) if ndmax is None else max(1, min(int(ndmax), len(x_c)))
+        self.groups = []
+        super().__init__(model, x_c, y_c, grid_x, grid_y, chunk_size, mask)
+
+    def _factorize(self):
+        # find the neighbors of every cell a chunk at a time, then factorize one kriging system per distinct
+        # neighbor set
+        cond_no = len(self.x_c)
+        tree = spatial.cKDTree(np.column_stack((self.x_c, self.y_c)))
+        _, cells = self.grid_cells()
+        query_size = max(1, min(self.chunk_size, NEIGHBOR_QUERY_SIZE // self.ndmax))
+
+        group_wells = {}
+        group_positions = {}
+        for start in range(0, len(cells), query_size):
+            _, index = tree.query(cells[start:start + query_size], k=self.ndmax,
+                                  distance_upper_bound=self.search_radius)
+            # wells out of range are reported as cond_no, sorting makes equal neighbor sets equal rows
+            neighbors = np.sort(np.asarray(index).reshape(-1, self.ndmax), axis=1)
+            krigable = np.flatnonzero((neighbors < cond_no).sum(axis=1) >= self.ndmin)
+            if not len(krigable):
+                continue
+            neighbor_sets, inverse = np.unique(neighbors[krigable], axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            order = np.argsort(inverse, kind='stable')
+            bounds = np.cumsum(np.bincount(inverse, minlength=len(neighbor_sets)))[:-1]
+            for neighbor_set, positions in zip(neighbor_sets, np.split(krigable[order] + start, bounds)):
+                wells = neighbor_set[neighbor_set < cond_no]
+                key = wells.tobytes()
+                if key not in group_wells:
+                    group_wells[key] = wells
+                    group_positions[key] = []
+                group_positions[key].append(positions)
+
+        for key, wells in group_wells.items():
+            local = OrdinaryKrigingSystem(self.model, self.x_c[wells], self.y_c[wells], [], [])
+            self.groups.append((np.concatenate(group_positions[key]), wells, local))
+
+    def krige(self, values):
+        """
+        Krig one or more time slices on the structured grid, cells without enough wells are NaN
+
+        Args:
+            values: Well values, shape (number of wells,) or (number of wells, number of slices)
+
+        Returns:
+            Fields of shape (len(grid_x), len(grid_y)), with a leading slice axis if values is 2D
+        """
+        values = np.asarray(values, dtype=float)
+        single = values.ndim == 1
+        values = values.reshape(len(self.x_c), -1)
+
+        cell_ids, cells = self.grid_cells()
+        fields = np.full((len(self.grid_x) * len(self.grid_y), values.shape[1]), np.nan)
+        for positions, wells, local in self.groups:
+            for start in range(0, len(positions), self.chunk_size):
+                chunk = positions[start:start + self.chunk_size]
+                fields[cell_ids[chunk]] = local.chunk_weights(cells[chunk, 0], cells[chunk, 1]).dot(values[wells])
+
+        fields = fields.T.reshape(values.shape[1], len(self.grid_x), len(self.grid_y))
+        return fields[0] if single else fields
+
+
+def make_kriging_system(model, x_c, y_c, grid_x, grid_y, neighborhood=None, mask=None):
+    """
+    Kriging system using every well, or a moving neighborhood when neighborhood is given
+
+    Args:
+        model: Fitted gstools covariance model
+        x_c: Well x coordinates
+        y_c: Well y coordinates
+        grid_x: Grid x axis
+        grid_y: Grid y axis
+        neighborhood: Optional dict with the search_radius, ndmin and ndmax of NeighborhoodKrigingSystem
+        mask: Optional boolean array of shape (len(grid_x), len(grid_y)), only True cells are kriged
+
+    Returns:
+        OrdinaryKrigingSystem or NeighborhoodKrigingSystem
+    """
+    if neighborhood is None:
+        return OrdinaryKrigingSystem(model, x_c, y_c, grid_x, grid_y, mask=mask)
+    return NeighborhoodKrigingSystem(model, x_c, y_c, grid_x, grid_y, mask=mask, **neighborhood)
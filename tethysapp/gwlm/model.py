@@ -1,14 +1,22 @@
+from datetime import datetime
+
+import pandas as pd
 from geoalchemy2 import Geometry
 from sqlalchemy import (Column,
                         Integer,
                         Boolean,
+                        DateTime,
                         Float,
                         String,
                         UniqueConstraint,
                         JSON,
                         ForeignKey,
                         Index,
-                        Sequence)
+                        Sequence,
+                        bindparam,
+                        inspect,
+                        select,
+                        text)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import (sessionmaker,
                             relationship,
@@ -18,6 +26,11 @@ Base = declarative_base()
 
 AQUIFER_ID_SEQ = Sequence('aquifer_id_seq')
 WELL_ID_SEQ = Sequence('well_id_seq')
+MIGRATION_BATCH_SIZE = 50000  # measurement rows back-filled per transaction
+MEASUREMENT_DATETIME_MIGRATION = 'measurement_ts_datetime'  # adds and back-fills measurement.ts_datetime
+DUPLICATE_MEASUREMENT_TABLE = 'measurement_duplicate'  # copies of the rows removed by deduplicate_measurements
+DUPLICATE_MEASUREMENT_JOIN = ('a.id > b.id AND a.variable_id = b.variable_id '
+                              'AND a.well_id = b.well_id AND a.ts_datetime = b.ts_datetime')
 
 
 # SQLAlchemy ORM definition for the Regions Table
@@ -117,19 +130,23 @@ class Measurement(Base):
     ts_time = Column(String)
     ts_value = Column(Float)
     ts_format = Column(String)
+    ts_datetime = Column(DateTime)
     ts_index = Index('ts_index', "well_id", "variable_id")
 
+    __table_args__ = (Index('_measurement_uc', 'variable_id', 'well_id', 'ts_datetime', unique=True),)
+
     well = relationship(Well,
                         primaryjoin='Well.id==Measurement.well_id',
                         backref=backref('wells',
                                         cascade='delete,all'))
 
-    def __init__(self, well_id, variable_id, ts_time, ts_value, ts_format):
+    def __init__(self, well_id, variable_id, ts_time, ts_value, ts_format, ts_datetime=None):
         self.well_id = well_id
         self.variable_id = variable_id
         self.ts_time = ts_time
         self.ts_value = ts_value
         self.ts_format = ts_format
+        self.ts_datetime = ts_datetime
 
 
 class Variable(Base):
@@ -149,6 +166,196 @@ class Variable(Base):
         self.description = description
 
 
+class JobStatus(Base):
+    """
+    SQLAlchemy Job Status Database table. Tracks the progress of work running in the background.
+    """
+
+    __tablename__ = 'job_status'
+    id = Column(String, primary_key=True)
+    job_type = Column(String)
+    status = Column(String)
+    progress = Column(Integer)
+    message = Column(String)
+    result = Column(JSON)
+    created = Column(DateTime)
+    updated = Column(DateTime)
+
+    def __init__(self, id, job_type, status='pending', progress=0, message='', result=None):
+        self.id = id
+        self.job_type = job_type
+        self.status = status
+        self.progress = progress
+        self.message = message
+        self.result = result
+        self.created = datetime.utcnow()
+        self.updated = self.created
+
+
+class SchemaMigration(Base):
+    """
+    SQLAlchemy Schema Migration Database table. Records the data migrations applied to the database.
+    """
+
+    __tablename__ = 'schema_migration'
+    name = Column(String, primary_key=True)
+    applied = Column(DateTime)
+
+    def __init__(self, name):
+        self.name = name
+        self.applied = datetime.utcnow()
+
+
+def migration_applied(engine, name):
+    """
+    Check if a data migration has been recorded as applied
+    """
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    applied = session.query(SchemaMigration).get(name) is not None
+    session.close()
+    return applied
+
+
+def record_migration(engine, name):
+    """
+    Record a data migration as applied, so it is not run again
+    """
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    session.merge(SchemaMigration(name))
+    session.commit()
+    session.close()
+
+
+def parse_ts_datetime(ts_time, ts_format):
+    """
+    Parse measurement time strings into naive UTC datetimes
+
+    Args:
+        ts_time: Pandas Series of time strings as uploaded
+        ts_format: strptime format of the time strings. Inferred when empty.
+
+    Returns:
+        Pandas datetime Series. Unparsable values are NaT.
+    """
+    ts_datetime = pd.to_datetime(ts_time.astype(str), format=ts_format or None, errors='coerce')
+    if getattr(ts_datetime.dt, 'tz', None) is not None:
+        ts_datetime = ts_datetime.dt.tz_convert('UTC').dt.tz_localize(None)
+    return ts_datetime
+
+
+def backfill_measurement_datetime(engine, batch_size=MIGRATION_BATCH_SIZE):
+    """
+    Populate ts_datetime for measurements added before the column existed. Works through the table in id
+    order, one transaction per batch, so it can be interrupted and resumed. Rows whose ts_time cannot be parsed
+    are left NULL, migrate_db records the back-fill once it completes so they are not scanned again.
+    """
+    table = Measurement.__table__
+    update_stmt = (table.update()
+                   .where(table.c.id == bindparam('m_id'))
+                   .values(ts_datetime=bindparam('m_datetime')))
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(select([table.c.id, table.c.ts_time, table.c.ts_format])
+                                      .where(table.c.ts_datetime.is_(None))
+                                      .where(table.c.id > last_id)
+                                      .order_by(table.c.id)
+                                      .limit(batch_size)).fetchall()
+            if not rows:
+                break
+            rows_df = pd.DataFrame(rows, columns=['m_id', 'ts_time', 'ts_format'])
+            last_id = int(rows_df.m_id.max())
+            rows_df['m_datetime'] = pd.NaT
+            for ts_format, group in rows_df.groupby(rows_df.ts_format.fillna('')):
+                rows_df.loc[group.index, 'm_datetime'] = parse_ts_datetime(group.ts_time, ts_format)
+            rows_df.dropna(subset=['m_datetime'], inplace=True)
+            records = [{'m_id': int(row.m_id), 'm_datetime': row.m_datetime.to_pydatetime()}
+                       for row in rows_df.itertuples()]
+            if records:
+                connection.execute(update_stmt, records)
+
+
+def migrate_db(engine):
+    """
+    Upgrade tables created by earlier versions of the app to the current definitions.
+    """
+    if not migration_applied(engine, MEASUREMENT_DATETIME_MIGRATION):
+        with engine.begin() as connection:
+            connection.execute(text('ALTER TABLE measurement ADD COLUMN IF NOT EXISTS ts_datetime TIMESTAMP'))
+
+        backfill_measurement_datetime(engine)
+        record_migration(engine, MEASUREMENT_DATETIME_MIGRATION)
+
+    if not has_measurement_unique_index(engine):
+        duplicates = count_duplicate_measurements(engine)
+        if duplicates:
+            # Removing user data is left to an explicit deduplicate_measurements run
+            # the add measurements page warns about the missing index too
+            print(f'The measurement table has {duplicates} duplicate rows (same variable, well and time). '
+                  f'The unique measurement index is not created and upsert uploads are unavailable until '
+                  f'deduplicate_measurements is run.')
+            with engine.begin() as connection:
+                connection.execute(text('CREATE INDEX IF NOT EXISTS ts_time_index '
+                                        'ON measurement (variable_id, well_id, ts_datetime)'))
+        else:
+            create_measurement_unique_index(engine)
+
+
+def has_measurement_unique_index(engine):
+    """
+    Check if the unique (variable, well, time) measurement index exists. It is missing while an upgraded database
+    still holds duplicate measurements, see deduplicate_measurements.
+    """
+    return '_measurement_uc' in [index['name'] for index in inspect(engine).get_indexes('measurement')]
+
+
+def count_duplicate_measurements(engine):
+    """
+    Count the measurements that repeat the variable, well and time of an earlier measurement
+    """
+    with engine.begin() as connection:
+        return connection.execute(text(f'SELECT COUNT(DISTINCT a.id) FROM measurement a '
+                                       f'JOIN measurement b ON {DUPLICATE_MEASUREMENT_JOIN}')).scalar()
+
+
+def create_measurement_unique_index(engine):
+    """
+    Replace the measurement time index with the unique (variable, well, time) index used by the uploads
+    """
+    with engine.begin() as connection:
+        connection.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS _measurement_uc '
+                                'ON measurement (variable_id, well_id, ts_datetime)'))
+        connection.execute(text('DROP INDEX IF EXISTS ts_time_index'))
+
+
+def deduplicate_measurements(engine):
+    """
+    Remove duplicate measurements and create the unique measurement index. Earlier versions of the app could
+    add the same measurement twice, the first copy (lowest id) of each is kept. The removed rows are copied to
+    the measurement_duplicate table first, so they can be reviewed or restored.
+
+    Run from the Tethys shell (tethys manage shell):
+
+        from tethysapp.gwlm.app import Gwlm
+        from tethysapp.gwlm.model import deduplicate_measurements
+        deduplicate_measurements(Gwlm.get_persistent_store_database('gwdb'))
+
+    Returns:
+        The number of measurements removed
+    """
+    with engine.begin() as connection:
+        connection.execute(text(f'CREATE TABLE IF NOT EXISTS {DUPLICATE_MEASUREMENT_TABLE} AS '
+                                f'SELECT * FROM measurement WITH NO DATA'))
+        removed = connection.execute(text(f'WITH removed AS (DELETE FROM measurement a USING measurement b '
+                                          f'WHERE {DUPLICATE_MEASUREMENT_JOIN} RETURNING a.*) '
+                                          f'INSERT INTO {DUPLICATE_MEASUREMENT_TABLE} SELECT * FROM removed')).rowcount
+    create_measurement_unique_index(engine)
+    print(f'Removed {removed} duplicate measurements, copies are kept in the {DUPLICATE_MEASUREMENT_TABLE} table')
+    return removed
+
+
 def init_db(engine, first_time):
     """
     Initializer for the primary database.
@@ -156,8 +363,15 @@ def init_db(engine, first_time):
     # Create all the tables
     Base.metadata.create_all(engine)
 
+    # Upgrade existing tables
+    if not first_time:
+        migrate_db(engine)
+
     # Add data
     if first_time:
+        # New tables already have the current definitions
+        record_migration(engine, MEASUREMENT_DATETIME_MIGRATION)
+
         # Make session
         Session = sessionmaker(bind=engine)
         session = Session()
@@ -122,7 +122,7 @@ var LIBRARY_OBJECT = (function() {
         xhr.done(function(return_data){ //Reset the form once the data is added successfully
             if("success" in return_data){
                 submit_button.html(submit_button_html);
-                reset_form(return_data);
+                poll_upload_status(return_data['job_id'], reset_form);
             }else{
                 submit_button.html(submit_button_html);
 
@@ -50,7 +50,9 @@ var LIBRARY_OBJECT = (function() {
             $("#format-text-input").val('');
             $("#aquifer_attributes").val('');
             reset_dropdown();
-            addSuccessMessage('measurements Upload Complete!');
+            addSuccessMessage('measurements Upload Complete! ' + result['rows'] + ' rows added at ' +
+                Math.round(result['rows_per_sec']) + ' rows/sec. ' + result['skipped'] +
+                ' rows were already in the database and skipped.');
         }
     };
 
@@ -158,6 +160,7 @@ var LIBRARY_OBJECT = (function() {
         data.append("region_id", region_id);
         data.append("aquifer_id", aquifer_id);
         data.append("aquifer_col", aquifer_col);
+        data.append("upsert", $("#upsert-input").is(":checked"));
 
         var submit_button = $("#submit-add-measurements");
         var submit_button_html = submit_button.html();
@@ -166,8 +169,7 @@ var LIBRARY_OBJECT = (function() {
         xhr.done(function(return_data){ //Reset the form once the data is added successfully
             if("success" in return_data){
                 submit_button.html(submit_button_html);
-                reset_form(return_data);
-                console.log(return_data);
+                poll_upload_status(return_data['job_id'], reset_form);
             }else{
                 addErrorMessage(return_data['error']);
             }
@@ -164,6 +164,7 @@ var LIBRARY_OBJECT = (function() {
         data.append("aquifer_id", aquifer_id);
         data.append("aquifer_col", aquifer_col);
         data.append("region_id", region_id);
+        data.append("upsert", $("#upsert-input").is(":checked"));
 
         var submit_button = $("#submit-add-wells");
         var submit_button_html = submit_button.html();
@@ -172,8 +173,7 @@ var LIBRARY_OBJECT = (function() {
         xhr.done(function(return_data){ //Reset the form once the data is added successfully
             if("success" in return_data){
                 submit_button.html(submit_button_html);
-                reset_form(return_data);
-                console.log(return_data);
+                poll_upload_status(return_data['job_id'], reset_form);
             }else{
                 addErrorMessage(return_data['error']);
             }
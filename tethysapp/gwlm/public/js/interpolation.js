@@ -39,7 +39,8 @@ var LIBRARY_OBJECT = (function() {
     //Reset the form when the request is made succesfully
     reset_form = function(result){
         if("success" in result){
-            addSuccessMessage('Interpolation Complete!');
+            addSuccessMessage('Interpolation job submitted. Track its progress in the ' +
+                '<a href="../dask/jobs_table/">Interpolation Jobs Table</a>.');
         }
     };
 
@@ -69,6 +70,7 @@ var LIBRARY_OBJECT = (function() {
         var spatial_interpolation = $("#select-spatial-interpolation option:selected").val();
         var temporal_interpolation = $("#select-temporal-interpolation option:selected").val();
         // var interpolation_options = $("#interpolation_options option:selected").val();
+        var neighborhood = $("#select-neighborhood option:selected").val();
         var search_radius = $("#select-search-radius option:selected").val();
         var ndmin = $("#select-ndmin option:selected").val();
         var ndmax = $("#select-ndmax option:selected").val();
@@ -84,6 +86,10 @@ var LIBRARY_OBJECT = (function() {
         var gap = $("#gap-size-input").val();
         var spacing = $("#spacing-input").val();
         var pad = $("#pad-input").val();
+        var variogram_policy = $("#variogram-policy option:selected").val();
+        var variogram_refit_every = $("#variogram-refit-input").val();
+        var hidden_units = $("#hidden-units-input").val();
+        var lamb_value = $("#lamb-value-input").val();
 
         // form_validator(region, "Region cannot be empty!");
         // if(region === ""){
@@ -120,6 +126,7 @@ var LIBRARY_OBJECT = (function() {
         data.append("spatial_interpolation", spatial_interpolation);
         data.append("temporal_interpolation", temporal_interpolation);
         // data.append("interpolation_options", interpolation_options);
+        data.append("neighborhood", neighborhood);
         data.append("search_radius", search_radius);
         data.append("ndmin", ndmin);
         data.append("ndmax", ndmax);
@@ -136,6 +143,10 @@ var LIBRARY_OBJECT = (function() {
         data.append("gap_size", gap);
         data.append("spacing", spacing);
         data.append("pad", pad);
+        data.append("variogram_policy", variogram_policy);
+        data.append("variogram_refit_every", variogram_refit_every);
+        data.append("hidden_units", hidden_units);
+        data.append("lamb_value", lamb_value);
 
 
         var submit_button = $("#submit");
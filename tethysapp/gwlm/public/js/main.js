@@ -177,6 +177,26 @@ function ajax_update_database_with_file(ajax_url, ajax_data,div_id) {
     return xhr;
 }
 
+//poll a background upload job until it finishes, then hand the upload response to on_complete
+function poll_upload_status(job_id, on_complete, div_id) {
+    var xhr = ajax_update_database("status", {'job_id': job_id});
+    xhr.done(function(data) {
+        if(!("success" in data)) {
+            addErrorMessage(data['error'], div_id);
+        } else if(data['status'] === 'complete') {
+            on_complete(data['result']);
+        } else if(data['status'] === 'error') {
+            addErrorMessage(data['result']['error'], div_id);
+        } else {
+            addInfoMessage("Processing upload. " + data['progress'] + " rows processed...", div_id);
+            setTimeout(function() {
+                poll_upload_status(job_id, on_complete, div_id);
+            }, 2000);
+        }
+    });
+    return xhr;
+}
+
 //form submission check function
 function checkTableCellInputWithError(input, safe_to_submit, error_msg) {
     var data_value = input.text();
@@ -0,0 +1,87 @@
+from typing import Dict, Union
+
+import numpy as np
+from scipy import linalg
+
+
+def ridge_gram(X: np.ndarray, mask: np.ndarray, lamb_value: float, penalty: np.ndarray) -> np.ndarray:
+    """
+    Regularized normal matrix of a ridge regression over the rows of X selected by mask
+
+    Args:
+        X: Hidden layer matrix, one row per time step
+        mask: Boolean array of the rows of X with an observation
+        lamb_value: Ridge regularization
+        penalty: Regularization weight of each column of X, 0 leaves the column unregularized
+
+    Returns:
+        X[mask].T.dot(X[mask]) + lamb_value * diag(penalty)
+    """
+    masked_X = X[mask]
+    gram = masked_X.T.dot(masked_X)
+    gram[np.diag_indices_from(gram)] += lamb_value * penalty
+    return gram
+
+
+def cholesky_factor(gram: np.ndarray) -> Union[tuple, None]:
+    """
+    Cholesky factorization of a symmetric positive definite normal matrix
+
+    Args:
+        gram: Regularized normal matrix
+
+    Returns:
+        Factorization to pass to scipy.linalg.cho_solve. None if the matrix is not positive definite.
+    """
+    try:
+        return linalg.cho_factor(gram, lower=True, overwrite_a=False, check_finite=False)
+    except linalg.LinAlgError:
+        return None
+
+
+def solve_masked_ridge(X: np.ndarray, labels: np.ndarray, lamb_value: float,
+                       penalty: Union[np.ndarray, None] = None) -> np.ndarray:
+    """
+    Solve a ridge regression of every column of labels on the rows of X where that column was observed.
+    Columns observed on the same rows share one Cholesky factorization and are solved together.
+
+    Args:
+        X: Hidden layer matrix, one row per time step
+        labels: Observations, one column per well, NaN where the well was not observed
+        lamb_value: Ridge regularization
+        penalty: Regularization weight of each column of X, defaults to regularizing every column
+
+    Returns:
+        Output weights, one column per well
+    """
+    if penalty is None:
+        penalty = np.ones(X.shape[1])
+
+    mask = ~np.isnan(labels)
+    ty = np.where(mask, labels, 0)  # unobserved rows are zeroed so they drop out of X.T.dot(ty)
+    rhs = X.T.dot(ty)
+    W_out = np.zeros((X.shape[1], labels.shape[1]))
+
+    # columns of X that are zero on every row cannot change the predictions, leave their weight at 0
+    # so an unregularized dead column does not make every system singular
+    active = X.any(axis=0)
+    X = X[:, active]
+    penalty = penalty[active]
+    rhs = rhs[active]
+
+    # group the wells by observation mask so each distinct mask is factorized once
+    mask_groups: Dict[bytes, list] = {}
+    for well_index, well_mask in enumerate(mask.T):
+        mask_groups.setdefault(np.packbits(well_mask).tobytes(), []).append(well_index)
+
+    for well_indexes in mask_groups.values():
+        gram = ridge_gram(X, mask[:, well_indexes[0]], lamb_value, penalty)
+        factor = cholesky_factor(gram)
+        if factor is not None:
+            weights = linalg.cho_solve(factor, rhs[:, well_indexes], check_finite=False)
+        else:
+            # too few observations to determine the unregularized columns, take the minimum norm solution
+            weights = np.linalg.lstsq(gram, rhs[:, well_indexes], rcond=-1)[0]
+        W_out[np.ix_(active, well_indexes)] = weights
+
+    return W_out
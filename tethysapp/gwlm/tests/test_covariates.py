@@ -0,0 +1,125 @@
+import datetime
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+import requests
+from tethys_sdk.testing import TethysTestCase
+
+from .. import covariates
+
+
+class CovariateCacheTestCase(TethysTestCase):
+    """
+    NetCDF disk cache of the THREDDS covariates
+    """
+
+    def set_up(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.bbox = (-100.5, 30.25, -99.75, 31.0)
+        index = pd.date_range('1950-01-01', periods=24, freq='MS')
+        self.df = pd.DataFrame({'pdsi': np.linspace(-3, 3, len(index))}, index=index)
+        self.df.iloc[5, 0] = np.nan
+
+    def tear_down(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def cached_value(self, **kwargs):
+        return covariates.get_cached_thredds_value('https://server/pdsi.nc', 'pdsi', self.bbox,
+                                                   cache_dir=self.cache_dir, **kwargs)
+
+    def test_round_trip(self):
+        cache_file = covariates.covariate_cache_path('https://server/pdsi.nc', 'pdsi', self.bbox, self.cache_dir)
+        covariates.write_covariate_cache(self.df, cache_file, 'https://server/pdsi.nc', 'pdsi', self.bbox)
+        pd.testing.assert_frame_equal(covariates.read_covariate_cache(cache_file), self.df, check_freq=False)
+        # only the finished file is left in the cache directory
+        self.assertEqual(os.listdir(self.cache_dir), [os.path.basename(cache_file)])
+
+    def test_cache_key(self):
+        path = covariates.covariate_cache_path('https://server/pdsi.nc', 'pdsi', self.bbox, self.cache_dir)
+        self.assertEqual(path, covariates.covariate_cache_path('https://server/pdsi.nc', 'pdsi', self.bbox,
+                                                               self.cache_dir))
+        other_bbox = (-100.5, 30.25, -99.75, 31.5)
+        self.assertNotEqual(path, covariates.covariate_cache_path('https://server/pdsi.nc', 'pdsi', other_bbox,
+                                                                  self.cache_dir))
+
+    def test_fetches_once(self):
+        with mock.patch.object(covariates, 'get_thredds_value', return_value=self.df) as fetch:
+            first = self.cached_value()
+            second = self.cached_value()
+        self.assertEqual(fetch.call_count, 1)
+        pd.testing.assert_frame_equal(first, self.df)
+        pd.testing.assert_frame_equal(second, self.df, check_freq=False)
+
+    def test_expired_cache_is_refreshed(self):
+        with mock.patch.object(covariates, 'get_thredds_value', return_value=self.df):
+            self.cached_value()
+        cache_file = os.listdir(self.cache_dir)[0]
+        expired = time.time() - 2 * covariates.COVARIATE_CACHE_TTL.total_seconds()
+        os.utime(os.path.join(self.cache_dir, cache_file), (expired, expired))
+
+        refreshed_df = self.df + 1
+        with mock.patch.object(covariates, 'get_thredds_value', return_value=refreshed_df) as fetch:
+            result = self.cached_value()
+        self.assertEqual(fetch.call_count, 1)
+        pd.testing.assert_frame_equal(result, refreshed_df)
+
+    def test_expired_cache_is_used_when_the_server_is_down(self):
+        with mock.patch.object(covariates, 'get_thredds_value', return_value=self.df):
+            self.cached_value()
+        cache_file = os.listdir(self.cache_dir)[0]
+        expired = time.time() - 2 * covariates.COVARIATE_CACHE_TTL.total_seconds()
+        os.utime(os.path.join(self.cache_dir, cache_file), (expired, expired))
+
+        with mock.patch.object(covariates, 'get_thredds_value', side_effect=requests.ConnectionError('down')):
+            result = self.cached_value()
+        pd.testing.assert_frame_equal(result, self.df, check_freq=False)
+
+    def test_server_error_without_cache_is_raised(self):
+        with mock.patch.object(covariates, 'get_thredds_value', side_effect=requests.ConnectionError('down')):
+            with self.assertRaises(requests.ConnectionError):
+                self.cached_value()
+
+    def test_eviction(self):
+        stale_file = os.path.join(self.cache_dir, 'soilw_stale.nc')
+        open(stale_file, 'w').close()
+        expired = time.time() - 2 * covariates.COVARIATE_CACHE_TTL.total_seconds()
+        os.utime(stale_file, (expired, expired))
+        with mock.patch.object(covariates, 'get_thredds_value', return_value=self.df):
+            self.cached_value()
+        self.assertFalse(os.path.exists(stale_file))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+
+class TimeBoundsTestCase(TethysTestCase):
+    """
+    Memoized THREDDS time bounds expire after the ttl
+    """
+
+    def set_up(self):
+        self.url = 'https://server/pdsi.nc?service=WMS&version=1.3.0&request=GetCapabilities'
+        self.root = ElementTree.fromstring(
+            '<WMS_Capabilities xmlns="http://www.opengis.net/wms">'
+            '<Dimension name="time">1950-01-01,1950-01-01,1950-02-01,1950-03-01</Dimension>'
+            '</WMS_Capabilities>')
+        covariates._time_bounds.clear()
+
+    def tear_down(self):
+        covariates._time_bounds.clear()
+
+    def test_requested_once_within_ttl(self):
+        with mock.patch.object(covariates, 'get_xml_root', return_value=self.root) as get_xml_root:
+            self.assertEqual(covariates.get_time_bounds(self.url), ('1950-01-01', '1950-03-01'))
+            self.assertEqual(covariates.get_time_bounds(self.url), ('1950-01-01', '1950-03-01'))
+        self.assertEqual(get_xml_root.call_count, 1)
+
+    def test_requested_again_after_ttl(self):
+        with mock.patch.object(covariates, 'get_xml_root', return_value=self.root) as get_xml_root:
+            covariates.get_time_bounds(self.url)
+            covariates.get_time_bounds(self.url, ttl=datetime.timedelta(seconds=-1))
+        self.assertEqual(get_xml_root.call_count, 2)
@@ -0,0 +1,159 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+from scipy import interpolate
+from tethys_sdk.testing import TethysTestCase
+
+from ..interpolation_utils import NC_FLOAT32, NC_PACKED, idw_field_generate, interp_well, nc_value_encoding
+
+
+def baseline_interp_well(wells_df, gap_size, pad, spacing):
+    # the per-well pandas implementation interp_well replaced, kept as the reference
+    well_interp_df = pd.DataFrame()
+    interp_index = pd.date_range(start=min(wells_df.index), freq=spacing, end=max(wells_df.index))
+    for well in wells_df:
+        temp_df = wells_df[well].dropna()
+        x_index = temp_df.index.astype('datetime64[ns]').astype('int64')
+        x_diff = temp_df.index.to_series().diff()
+        fit2 = interpolate.pchip(x_index, temp_df)
+        ynew = fit2(interp_index.astype('datetime64[ns]').astype('int64'))
+        interp_df = pd.DataFrame(ynew, index=interp_index, columns=[well])
+        gaps = np.where(x_diff > gap_size)
+        for g in gaps[0]:
+            start = x_diff.index[g - 1] + datetime.timedelta(days=pad)
+            end = x_diff.index[g] - datetime.timedelta(days=pad)
+            interp_df[start:end] = np.nan
+        beg_meas_date = x_diff.index[0]
+        end_meas_date = temp_df.index[-1]
+        interp_df[interp_df.index < beg_meas_date] = np.nan
+        interp_df[interp_df.index >= end_meas_date] = np.nan
+        well_interp_df = pd.concat([well_interp_df, interp_df], join="outer", axis=1, sort=False)
+    return well_interp_df
+
+
+class InterpWellTestCase(TethysTestCase):
+    """
+    Vectorized interp_well against the baseline per-well implementation
+    """
+
+    def set_up(self):
+        rng = np.random.default_rng(7)
+        wells = {}
+        for well in range(6):
+            # irregular sampling with a few multi year gaps
+            days = np.cumsum(rng.choice([20, 45, 90, 200, 500, 900], size=40, p=[.3, .3, .2, .1, .06, .04]))
+            dates = pd.Timestamp('1960-01-01') + pd.to_timedelta(days + well * 17, unit='D')
+            wells[well] = pd.Series(100 + np.cumsum(rng.normal(size=len(dates))), index=dates)
+        self.wells_df = pd.concat(wells, axis=1, sort=True)
+
+    def test_matches_baseline(self):
+        for gap_size in ('365 days', '730 days'):
+            for pad in (0, 30, 90, 400):
+                expected = baseline_interp_well(self.wells_df, gap_size, pad, '1MS')
+                result = interp_well(self.wells_df, gap_size, pad, '1MS')
+                pd.testing.assert_frame_equal(result, expected, check_freq=False, check_names=False)
+
+    def test_unsorted_input(self):
+        expected = interp_well(self.wells_df, '365 days', 90, '1MS')
+        result = interp_well(self.wells_df.sample(frac=1, random_state=3), '365 days', 90, '1MS')
+        pd.testing.assert_frame_equal(result, expected, check_freq=False)
+
+    def test_well_with_one_measurement_is_empty(self):
+        wells_df = self.wells_df.copy()
+        wells_df[6] = np.nan
+        wells_df.iloc[10, 6] = 5.0
+        result = interp_well(wells_df, '365 days', 90, '1MS')
+        self.assertTrue(result[6].isna().all())
+        pd.testing.assert_frame_equal(result[list(range(6))],
+                                      interp_well(self.wells_df, '365 days', 90, '1MS'), check_freq=False)
+
+
+def brute_force_idw(x_c, y_c, values, x, y, search_radius, ndmin, ndmax, power):
+    # inverse distance weighting of one point from its ndmax nearest wells within search_radius
+    dist = np.hypot(np.asarray(x_c) - x, np.asarray(y_c) - y)
+    wells = np.argsort(dist, kind='stable')[:ndmax]
+    wells = wells[dist[wells] <= search_radius]
+    if len(wells) < ndmin:
+        return np.nan
+    if dist[wells[0]] == 0:
+        return np.mean(values[wells[dist[wells] == 0]])
+    weights = 1.0 / dist[wells] ** power
+    return np.sum(weights * values[wells]) / np.sum(weights)
+
+
+class IDWTestCase(TethysTestCase):
+    """
+    Chunked idw_field_generate against a cell by cell inverse distance weighting
+    """
+
+    def set_up(self):
+        rng = np.random.default_rng(3)
+        self.x_c = rng.uniform(0, 10, 20)
+        self.y_c = rng.uniform(0, 8, 20)
+        self.values = rng.normal(100, 10, (20, 3))
+        self.grid_x = np.linspace(0, 10, 11)
+        self.grid_y = np.linspace(0, 8, 9)
+        # a cell on top of a well
+        self.x_c[0], self.y_c[0] = self.grid_x[4], self.grid_y[2]
+
+    def brute_force_fields(self, search_radius, ndmin, ndmax, mask=None):
+        fields = np.full((self.values.shape[1], len(self.grid_x), len(self.grid_y)), np.nan)
+        for i, x in enumerate(self.grid_x):
+            for j, y in enumerate(self.grid_y):
+                if mask is not None and not mask[i, j]:
+                    continue
+                for step in range(self.values.shape[1]):
+                    fields[step, i, j] = brute_force_idw(self.x_c, self.y_c, self.values[:, step], x, y,
+                                                         search_radius, ndmin, ndmax, 2)
+        return fields
+
+    def test_all_wells(self):
+        fields = idw_field_generate(self.x_c, self.y_c, self.values, self.grid_x, self.grid_y)
+        np.testing.assert_allclose(fields, self.brute_force_fields(np.inf, 1, len(self.x_c)), rtol=1e-12)
+
+    def test_all_wells_within_search_radius(self):
+        fields = idw_field_generate(self.x_c, self.y_c, self.values, self.grid_x, self.grid_y, search_radius=2.5,
+                                    ndmin=2)
+        expected = self.brute_force_fields(2.5, 2, len(self.x_c))
+        self.assertTrue(np.isnan(expected).any() and np.isfinite(expected).any())
+        np.testing.assert_allclose(fields, expected, rtol=1e-12)
+
+    def test_cell_on_top_of_two_wells(self):
+        self.x_c[1:3], self.y_c[1:3] = self.grid_x[7], self.grid_y[5]
+        fields = idw_field_generate(self.x_c, self.y_c, self.values, self.grid_x, self.grid_y)
+        np.testing.assert_allclose(fields[:, 7, 5], self.values[1:3].mean(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(fields, self.brute_force_fields(np.inf, 1, len(self.x_c)), rtol=1e-12)
+
+    def test_neighborhood(self):
+        fields = idw_field_generate(self.x_c, self.y_c, self.values, self.grid_x, self.grid_y, search_radius=2.5,
+                                    ndmax=5, ndmin=3)
+        expected = self.brute_force_fields(2.5, 3, 5)
+        self.assertTrue(np.isnan(expected).any() and np.isfinite(expected).any())
+        np.testing.assert_allclose(fields, expected, rtol=1e-12)
+
+    def test_mask_and_single_time_step(self):
+        mask = np.zeros((len(self.grid_x), len(self.grid_y)), dtype=bool)
+        mask[2:8, 1:6] = True
+        field = idw_field_generate(self.x_c, self.y_c, self.values[:, 0], self.grid_x, self.grid_y,
+                                   search_radius=3, ndmax=4, mask=mask)
+        np.testing.assert_allclose(field, self.brute_force_fields(3, 1, 4, mask)[0], rtol=1e-12)
+
+
+class NCValueEncodingTestCase(TethysTestCase):
+    """
+    tsvalue encodings of the interpolation NetCDF files
+    """
+
+    def test_packed_range_covers_the_well_values(self):
+        values = np.array([[10.0, np.nan], [30.0, 20.0]])
+        datatype, fill_value, attributes, (low, high) = nc_value_encoding(NC_PACKED, values)
+        self.assertEqual(datatype, np.int16)
+        self.assertTrue(low < 10 and high > 30)
+        # the packed range maps onto the int16 values above the fill value
+        self.assertAlmostEqual(attributes['add_offset'] - 32767 * attributes['scale_factor'], low)
+        self.assertAlmostEqual(attributes['add_offset'] + 32767 * attributes['scale_factor'], high)
+
+    def test_packed_without_values_falls_back_to_float32(self):
+        for values in (np.full((3, 2), np.nan), np.empty((0, 4))):
+            self.assertEqual(nc_value_encoding(NC_PACKED, values), nc_value_encoding(NC_FLOAT32, values))
@@ -0,0 +1,109 @@
+import gstools as gs
+import numpy as np
+from tethys_sdk.testing import TethysTestCase
+
+from ..kriging import NeighborhoodKrigingSystem, OrdinaryKrigingSystem
+
+
+class OrdinaryKrigingTestCase(TethysTestCase):
+    """
+    Precomputed kriging system against gstools ordinary kriging
+    """
+
+    def set_up(self):
+        rng = np.random.default_rng(11)
+        self.model = gs.Exponential(dim=2, var=4.0, len_scale=30.0)
+        self.x_c = rng.uniform(0, 100, 25)
+        self.y_c = rng.uniform(0, 80, 25)
+        self.values = rng.normal(50, 5, (25, 3))
+        self.grid_x = np.linspace(0, 100, 21)
+        self.grid_y = np.linspace(0, 80, 17)
+
+    def test_matches_gstools(self):
+        system = OrdinaryKrigingSystem(self.model, self.x_c, self.y_c, self.grid_x, self.grid_y, chunk_size=50)
+        self.assertIsNone(system._inverse)
+        fields = system.krige(self.values)
+        for step in range(self.values.shape[1]):
+            krig_map = gs.krige.Ordinary(self.model, cond_pos=[self.x_c, self.y_c], cond_val=self.values[:, step])
+            krig_map.structured([self.grid_x, self.grid_y])
+            np.testing.assert_allclose(fields[step], krig_map.field, rtol=1e-7, atol=1e-7)
+
+    def test_mask(self):
+        mask = np.zeros((len(self.grid_x), len(self.grid_y)), dtype=bool)
+        mask[3:15, 2:9] = True
+        field = OrdinaryKrigingSystem(self.model, self.x_c, self.y_c, self.grid_x, self.grid_y,
+                                      mask=mask).krige(self.values[:, 0])
+        expected = OrdinaryKrigingSystem(self.model, self.x_c, self.y_c, self.grid_x, self.grid_y).krige(
+            self.values[:, 0])
+        self.assertTrue(np.isnan(field[~mask]).all())
+        np.testing.assert_allclose(field[mask], expected[mask])
+
+    def test_near_duplicate_wells_use_the_pseudo_inverse(self):
+        # a second measurement of the first well recorded a hair away from it
+        x_c = np.append(self.x_c, self.x_c[0] + 1e-12)
+        y_c = np.append(self.y_c, self.y_c[0])
+        values = np.append(self.values[:, 0], self.values[0, 0])
+        system = OrdinaryKrigingSystem(self.model, x_c, y_c, self.grid_x, self.grid_y)
+        self.assertIsNotNone(system._inverse)
+        field = system.krige(values)
+        self.assertTrue(np.isfinite(field).all())
+        expected = OrdinaryKrigingSystem(self.model, self.x_c, self.y_c, self.grid_x, self.grid_y).krige(
+            self.values[:, 0])
+        np.testing.assert_allclose(field, expected, rtol=1e-6, atol=1e-6)
+
+
+class NeighborhoodKrigingTestCase(TethysTestCase):
+    """
+    Moving neighborhood kriging against kriging every cell from its own wells
+    """
+
+    def set_up(self):
+        rng = np.random.default_rng(5)
+        self.model = gs.Exponential(dim=2, var=4.0, len_scale=30.0)
+        self.x_c = rng.uniform(0, 100, 30)
+        self.y_c = rng.uniform(0, 80, 30)
+        self.values = rng.normal(50, 5, (30, 2))
+        self.grid_x = np.linspace(0, 100, 21)
+        self.grid_y = np.linspace(0, 80, 17)
+
+    def test_no_limits_matches_global(self):
+        fields = NeighborhoodKrigingSystem(self.model, self.x_c, self.y_c, self.grid_x, self.grid_y,
+                                           chunk_size=40).krige(self.values)
+        expected = OrdinaryKrigingSystem(self.model, self.x_c, self.y_c, self.grid_x, self.grid_y).krige(self.values)
+        np.testing.assert_allclose(fields, expected, rtol=1e-10, atol=1e-10)
+
+    def test_matches_per_cell_kriging(self):
+        # small chunks, so cells sharing a neighbor set are found in different chunks
+        system = NeighborhoodKrigingSystem(self.model, self.x_c, self.y_c, self.grid_x, self.grid_y,
+                                           search_radius=25, ndmin=3, ndmax=6, chunk_size=7)
+        field = system.krige(self.values[:, 0])
+        self.assertEqual(len(system.groups), len({wells.tobytes() for _, wells, _ in system.groups}))
+        for i, x in enumerate(self.grid_x):
+            for j, y in enumerate(self.grid_y):
+                dist = np.hypot(self.x_c - x, self.y_c - y)
+                wells = np.argsort(dist, kind='stable')[:6]
+                wells = wells[dist[wells] <= 25]
+                if len(wells) < 3:
+                    self.assertTrue(np.isnan(field[i, j]))
+                    continue
+                local = OrdinaryKrigingSystem(self.model, self.x_c[wells], self.y_c[wells], [x], [y])
+                np.testing.assert_allclose(field[i, j], local.krige(self.values[wells, 0])[0, 0], rtol=1e-10)
+
+    def test_cells_without_enough_wells_are_empty(self):
+        field = NeighborhoodKrigingSystem(self.model, self.x_c, self.y_c, self.grid_x, self.grid_y,
+                                          search_radius=15, ndmin=4).krige(self.values[:, 0])
+        mesh_x, mesh_y = np.meshgrid(self.grid_x, self.grid_y, indexing='ij')
+        in_range = (np.hypot(mesh_x[..., np.newaxis] - self.x_c, mesh_y[..., np.newaxis] - self.y_c) <= 15).sum(axis=2)
+        self.assertTrue(np.isnan(field[in_range < 4]).all())
+        self.assertTrue(np.isfinite(field[in_range >= 4]).all())
+        self.assertTrue((in_range < 4).any() and (in_range >= 4).any())
+
+    def test_mask(self):
+        mask = np.zeros((len(self.grid_x), len(self.grid_y)), dtype=bool)
+        mask[3:15, 2:9] = True
+        field = NeighborhoodKrigingSystem(self.model, self.x_c, self.y_c, self.grid_x, self.grid_y, ndmax=8,
+                                          mask=mask).krige(self.values[:, 0])
+        expected = NeighborhoodKrigingSystem(self.model, self.x_c, self.y_c, self.grid_x, self.grid_y,
+                                             ndmax=8).krige(self.values[:, 0])
+        self.assertTrue(np.isnan(field[~mask]).all())
+        np.testing.assert_allclose(field[mask], expected[mask])
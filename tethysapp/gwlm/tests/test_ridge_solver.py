@@ -0,0 +1,70 @@
+import numpy as np
+from tethys_sdk.testing import TethysTestCase
+
+from ..ridge_solver import solve_masked_ridge
+
+
+def reference_ridge(X, labels, lamb_value, penalty):
+    # one dense solve per well over the rows where the well was observed
+    W_out = np.zeros((X.shape[1], labels.shape[1]))
+    for well in range(labels.shape[1]):
+        observed = ~np.isnan(labels[:, well])
+        masked_X = X[observed]
+        gram = masked_X.T.dot(masked_X) + lamb_value * np.diag(penalty)
+        W_out[:, well] = np.linalg.solve(gram, masked_X.T.dot(labels[observed, well]))
+    return W_out
+
+
+class RidgeSolverTestCase(TethysTestCase):
+    """
+    solve_masked_ridge against a per-well np.linalg.solve of the regularized normal equations
+    """
+
+    def set_up(self):
+        rng = np.random.default_rng(42)
+        self.X = np.maximum(rng.normal(size=(120, 30)), 0)
+        self.labels = rng.normal(size=(120, 8))
+        # wells observed on different rows, two of them on the same rows so they share a factorization
+        self.labels[rng.random(self.labels.shape) < 0.3] = np.nan
+        self.labels[:, 1] = np.where(np.isnan(self.labels[:, 0]), np.nan, self.labels[:, 1])
+        self.labels[:60, 7] = np.nan
+
+    def test_matches_dense_solve(self):
+        penalty = np.ones(self.X.shape[1])
+        W_out = solve_masked_ridge(self.X, self.labels, 100, penalty)
+        np.testing.assert_allclose(W_out, reference_ridge(self.X, self.labels, 100, penalty), rtol=1e-8, atol=1e-10)
+
+    def test_default_penalty_regularizes_every_column(self):
+        W_out = solve_masked_ridge(self.X, self.labels, 10)
+        np.testing.assert_allclose(W_out, reference_ridge(self.X, self.labels, 10, np.ones(self.X.shape[1])),
+                                   rtol=1e-8, atol=1e-10)
+
+    def test_unregularized_columns(self):
+        # impute_data leaves the last two hidden units unregularized
+        penalty = np.ones(self.X.shape[1])
+        penalty[-2:] = 0
+        W_out = solve_masked_ridge(self.X, self.labels, 100, penalty)
+        np.testing.assert_allclose(W_out, reference_ridge(self.X, self.labels, 100, penalty), rtol=1e-7, atol=1e-9)
+
+    def test_dead_columns_get_zero_weight(self):
+        # relu units that are zero on every row cannot change a prediction
+        X = self.X.copy()
+        X[:, [3, 29]] = 0
+        penalty = np.ones(X.shape[1])
+        penalty[-2:] = 0
+        W_out = solve_masked_ridge(X, self.labels, 100, penalty)
+        self.assertTrue(np.all(W_out[[3, 29]] == 0))
+
+        active = np.ones(X.shape[1], dtype=bool)
+        active[[3, 29]] = False
+        expected = reference_ridge(X[:, active], self.labels, 100, penalty[active])
+        np.testing.assert_allclose(W_out[active], expected, rtol=1e-7, atol=1e-9)
+
+    def test_underdetermined_well_falls_back_to_least_squares(self):
+        # a well with fewer observations than unregularized columns has a singular normal matrix
+        labels = np.full((self.X.shape[0], 1), np.nan)
+        labels[0, 0] = 1.0
+        penalty = np.zeros(self.X.shape[1])
+        W_out = solve_masked_ridge(self.X, labels, 100, penalty)
+        self.assertTrue(np.all(np.isfinite(W_out)))
+        np.testing.assert_allclose(self.X[:1].dot(W_out), [[1.0]], rtol=1e-6)
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from tethys_sdk.testing import TethysTestCase
+
+from ..model import Measurement
+from ..utils import (bulk_insert_measurements,
+                     get_upload_chunks,
+                     map_well_ids,
+                     parse_upload_size)
+
+
+class UploadChunkTestCase(TethysTestCase):
+    """
+    Chunked reading of uploaded point files and the mapping of their well ids across chunks
+    """
+
+    def set_up(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.upload_df = pd.DataFrame({'well_id': ['001', '002', '003', '001', '002', '003', '004'],
+                                       'aquifer_id': [1, 1, 1, 2, 2, 2, 2],
+                                       'value': [1.5, 2.5, 3.5, 4.5, 5.5, 6.5, 7.5]})
+        self.upload_df.to_csv(os.path.join(self.temp_dir, 'measurements.csv'), index=False)
+
+    def tear_down(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_chunks_cover_every_row_once(self):
+        for chunk_size in (1, 2, 3, 7, 10):
+            chunks, temp_dir = get_upload_chunks(self.temp_dir, None, chunk_size, dtype={'well_id': str})
+            chunks = list(chunks)
+            self.assertEqual(temp_dir, self.temp_dir)
+            self.assertEqual(len(chunks), -(-len(self.upload_df) // chunk_size))
+            self.assertTrue(all(len(chunk) <= chunk_size for chunk in chunks))
+            pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), self.upload_df)
+
+    def test_whole_file_chunk(self):
+        chunks, _ = get_upload_chunks(self.temp_dir, None, None, dtype={'well_id': str})
+        chunks = list(chunks)
+        self.assertEqual(len(chunks), 1)
+        pd.testing.assert_frame_equal(chunks[0], self.upload_df)
+
+    def test_well_ids_are_mapped_per_aquifer_across_chunks(self):
+        # well 001 exists in both aquifers, each must map to the well of its own aquifer
+        wells = [SimpleNamespace(aquifer_id=1, well_id='001', id=11),
+                 SimpleNamespace(aquifer_id=1, well_id='002', id=12),
+                 SimpleNamespace(aquifer_id=1, well_id='003', id=13),
+                 SimpleNamespace(aquifer_id=2, well_id='001', id=21),
+                 SimpleNamespace(aquifer_id=2, well_id='002', id=22),
+                 SimpleNamespace(aquifer_id=2, well_id='003', id=23)]
+        session = mock.MagicMock()
+        session.query.return_value.filter.return_value.all.return_value = wells
+
+        well_dict = {}
+        chunks, _ = get_upload_chunks(self.temp_dir, None, 2, dtype={'well_id': str})
+        mapped = pd.concat([map_well_ids(session, chunk, well_dict) for chunk in chunks], ignore_index=True)
+
+        self.assertEqual(mapped['well_id'].tolist()[:6], [11, 12, 13, 21, 22, 23])
+        # well 004 is not in the database
+        self.assertTrue(pd.isna(mapped['well_id'].iloc[6]))
+        self.assertEqual(well_dict[(1, '001')], 11)
+        self.assertEqual(well_dict[(2, '001')], 21)
+
+    def test_cached_wells_are_not_queried_again(self):
+        session = mock.MagicMock()
+        session.query.return_value.filter.return_value.all.return_value = [
+            SimpleNamespace(aquifer_id=1, well_id='001', id=11)]
+        well_dict = {}
+        chunk = pd.DataFrame({'well_id': ['001'], 'aquifer_id': [1]})
+        map_well_ids(session, chunk.copy(), well_dict)
+        map_well_ids(session, chunk.copy(), well_dict)
+        self.assertEqual(session.query.call_count, 1)
+
+
+class UploadSizeTestCase(TethysTestCase):
+    """
+    Batch and chunk sizes posted with the upload forms
+    """
+
+    def test_missing_size_uses_the_default(self):
+        self.assertEqual(parse_upload_size(None, 500), 500)
+        self.assertEqual(parse_upload_size('', 500), 500)
+
+    def test_size(self):
+        self.assertEqual(parse_upload_size('1', 500), 1)
+        self.assertEqual(parse_upload_size('20000', 500), 20000)
+
+    def test_invalid_sizes(self):
+        for value in ('abc', '1.5', '0', '-10'):
+            with self.assertRaises(ValueError):
+                parse_upload_size(value, 500)
+
+
+class SQLiteMeasurementInsertTestCase(TethysTestCase):
+    """
+    Batched executemany measurement inserts used on databases other than PostgreSQL
+    """
+
+    def set_up(self):
+        self.engine = create_engine('sqlite://')
+        Measurement.__table__.create(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.measurements_df = pd.DataFrame({'well_id': [1, 1, 2],
+                                             'variable_id': [1, 1, 1],
+                                             'ts_time': ['2000-01-01', '2000-02-01', '2000-01-01'],
+                                             'ts_value': [1.0, 2.0, 3.0],
+                                             'ts_format': '%Y-%m-%d'})
+        self.measurements_df['ts_datetime'] = pd.to_datetime(self.measurements_df['ts_time'])
+
+    def tear_down(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def stored_values(self):
+        return sorted(value for value, in self.session.query(Measurement.ts_value))
+
+    def test_existing_measurements_are_skipped(self):
+        self.assertEqual(bulk_insert_measurements(self.session, self.measurements_df, batch_size=2), 3)
+        self.assertEqual(bulk_insert_measurements(self.session, self.measurements_df, batch_size=2), 0)
+        self.assertEqual(self.stored_values(), [1.0, 2.0, 3.0])
+
+    def test_upsert_updates_existing_measurements(self):
+        bulk_insert_measurements(self.session, self.measurements_df, batch_size=2)
+        updated_df = self.measurements_df.copy()
+        updated_df['ts_value'] = [1.0, 2.0, 4.0]
+        bulk_insert_measurements(self.session, updated_df, batch_size=2, upsert=True)
+        self.assertEqual(self.stored_values(), [1.0, 2.0, 4.0])
+
+    def test_upsert_needs_the_unique_index(self):
+        with self.assertRaises(ValueError):
+            bulk_insert_measurements(self.session, self.measurements_df, upsert=True, unique_index=False)
@@ -1,19 +1,21 @@
 import calendar
+import io
 import json
 import os
 import shutil
 import time
 import uuid
 from datetime import datetime
-from typing import List, Any, Dict, Tuple, Union
+from typing import List, Any, Callable, Dict, Iterator, Tuple, Union
 
 import geopandas as gpd
 import pandas as pd
 import plotly.graph_objects as go
-import simplejson
 import xarray as xr
 from pandarallel import pandarallel
 from shapely import wkt
+from sqlalchemy import cast, or_, text
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
 from sqlalchemy.sql import func
 from tethys_sdk.gizmos import (TextInput,
                                SelectInput)
@@ -24,7 +26,18 @@ from .model import (Region,
                     Aquifer,
                     Well,
                     Measurement,
-                    Variable)
+                    Variable,
+                    JobStatus,
+                    has_measurement_unique_index,
+                    parse_ts_datetime)
+
+MEASUREMENT_BATCH_SIZE = 50000  # rows written per COPY/executemany call
+MEASUREMENT_COLUMNS = ['well_id', 'variable_id', 'ts_time', 'ts_value', 'ts_format', 'ts_datetime']
+MEASUREMENT_KEY = ['variable_id', 'well_id', 'ts_datetime']  # natural key used by the upsert mode
+UPLOAD_CHUNK_SIZE = 100000  # rows read from an uploaded csv per chunk
+AQUIFER_BATCH_SIZE = 50  # aquifers written per flush of an aquifer upload, progress is reported after each
+UPSERT_UNAVAILABLE = ('Updating existing measurements is unavailable, the measurement table has duplicate '
+                      'measurements. Remove them with deduplicate_measurements, see the setup guide.')
 
 
 def user_permission_test(user):
@@ -318,7 +331,8 @@ def process_aquifer_shapefile(shapefile: Any,
                               region_id: int,
                               name_attr: str,
                               id_attr: str,
-                              app_workspace: Any) -> Dict:
+                              app_workspace: Any,
+                              progress_callback: Union[Callable, None] = None) -> Dict:
     """
     Process uploaded auifer shapefile
 
@@ -328,6 +342,7 @@ def process_aquifer_shapefile(shapefile: Any,
         name_attr: Aquifer Name Column
         id_attr: Aquifer Id Column
         app_workspace: Temp App workspace
+        progress_callback: Optional function called with the number of aquifers added
 
     Returns:
         Response dict with success or error string
@@ -351,9 +366,14 @@ def process_aquifer_shapefile(shapefile: Any,
                        id_attr: 'aquifer_id'}
         gdf.rename(columns=rename_cols, inplace=True)
         gdf = gdf[['aquifer_name', 'aquifer_id', 'geometry']]
-        aquifer_list = gdf.parallel_apply(add_aquifer_apply, axis=1)
-
-        session.add_all(aquifer_list)
+        aquifer_list = list(gdf.parallel_apply(add_aquifer_apply, axis=1))
+
+        # written in batches within one transaction, so progress is reported while large outlines are stored
+        for start in range(0, len(aquifer_list), AQUIFER_BATCH_SIZE):
+            session.add_all(aquifer_list[start:start + AQUIFER_BATCH_SIZE])
+            session.flush()
+            if progress_callback is not None:
+                progress_callback(min(start + AQUIFER_BATCH_SIZE, len(aquifer_list)))
         session.commit()
         session.close()
         end_time = time.time()
@@ -374,33 +394,48 @@ def process_aquifer_shapefile(shapefile: Any,
                 shutil.rmtree(temp_dir)
 
 
-def get_shapefile_gdf(shapefile: Any,
-                      app_workspace: Any,
-                      polygons: bool = True) -> Tuple[Any, Any]:
+def save_upload_files(shapefile: Any, app_workspace: Any) -> str:
     """
-    Helper function to process uploaded shapefile
+    Write the uploaded files to a new temporary directory in the app workspace
 
     Args:
-        shapefile: List of shapefile files
+        shapefile: List of uploaded files, or the path of a directory the files were already saved to
         app_workspace: Temp App Workspace
-        polygons: Boolean to determine a polygon or point shapefile
 
     Returns:
-        GeoDataFrame of the shapefile, Temp Directory of the processed shapefile
+        Path to the temporary directory holding the uploaded files
     """
+    if isinstance(shapefile, str):
+        # Already written to disk, e.g. before handing the upload to a background job
+        return shapefile
+
     temp_id = uuid.uuid4()
     temp_dir = os.path.join(app_workspace.path, str(temp_id))
     os.makedirs(temp_dir)
-    gbyos_pol_shp = None
-    upload_csv = None
-    gdf = None
 
     for f in shapefile:
         f_name = f.name
         f_path = os.path.join(temp_dir, f_name)
 
         with open(f_path, 'wb') as f_local:
-            f_local.write(f.read())
+            for chunk in f.chunks():
+                f_local.write(chunk)
+
+    return temp_dir
+
+
+def find_upload_files(temp_dir: str) -> Tuple[Any, Any]:
+    """
+    Find the shapefile/geojson and csv files in an upload directory
+
+    Args:
+        temp_dir: Directory with the uploaded files
+
+    Returns:
+        Path to the shapefile or geojson file, Path to the csv file. Either is None if not uploaded.
+    """
+    gbyos_pol_shp = None
+    upload_csv = None
 
     for file in os.listdir(temp_dir):
         # Reading the shapefile only
@@ -412,11 +447,32 @@ def get_shapefile_gdf(shapefile: Any,
             f_path = os.path.join(temp_dir, file)
             upload_csv = f_path
 
+    return gbyos_pol_shp, upload_csv
+
+
+def get_shapefile_gdf(shapefile: Any,
+                      app_workspace: Any,
+                      polygons: bool = True) -> Tuple[Any, Any]:
+    """
+    Helper function to process uploaded shapefile
+
+    Args:
+        shapefile: List of shapefile files
+        app_workspace: Temp App Workspace
+        polygons: Boolean to determine a polygon or point shapefile
+
+    Returns:
+        GeoDataFrame of the shapefile, Temp Directory of the processed shapefile
+    """
+    temp_dir = save_upload_files(shapefile, app_workspace)
+    gbyos_pol_shp, upload_csv = find_upload_files(temp_dir)
+    gdf = None
+
     if gbyos_pol_shp is not None:
         gdf = gpd.read_file(gbyos_pol_shp)
 
     if upload_csv is not None:
-        df = pd.read_csv(upload_csv, engine='python')
+        df = pd.read_csv(upload_csv)
         if polygons:
             gdf = gpd.GeoDataFrame(df, crs={'init': 'epsg:4326'}, geometry=df['geometry'].apply(wkt.loads))
         else:
@@ -425,6 +481,88 @@ def get_shapefile_gdf(shapefile: Any,
     return gdf, temp_dir
 
 
+def get_upload_chunks(shapefile: Any,
+                      app_workspace: Any,
+                      chunk_size: Union[int, None] = UPLOAD_CHUNK_SIZE,
+                      dtype: Union[Dict, None] = None) -> Tuple[Iterator, Any]:
+    """
+    Helper function to stream an uploaded point file in fixed-size chunks so that memory use is bounded
+    regardless of the file size. CSV files are read with the C parser; shapefiles and geojson files
+    cannot be streamed and are returned as a single chunk.
+
+    Args:
+        shapefile: List of uploaded files
+        app_workspace: Temp App Workspace
+        chunk_size: Number of rows per chunk. None reads the whole file as one chunk.
+        dtype: Optional column dtypes passed to the csv reader, e.g. to keep id columns as strings
+
+    Returns:
+        Iterator of DataFrame chunks, Temp Directory of the uploaded files
+    """
+    temp_dir = save_upload_files(shapefile, app_workspace)
+    gbyos_pol_shp, upload_csv = find_upload_files(temp_dir)
+    chunks = iter([])
+
+    if gbyos_pol_shp is not None:
+        chunks = iter([gpd.read_file(gbyos_pol_shp)])
+
+    if upload_csv is not None:
+        if chunk_size:
+            chunks = pd.read_csv(upload_csv, engine='c', dtype=dtype, chunksize=chunk_size)
+        else:
+            chunks = iter([pd.read_csv(upload_csv, engine='c', dtype=dtype)])
+
+    return chunks, temp_dir
+
+
+def map_aquifer_ids(session: Any, df: Any, region_id: int, aq_dict: Dict) -> Any:
+    """
+    Map the aquifer id column of an upload chunk to the aquifer ids listed in the database
+
+    Args:
+        session: SQL Alchemy Session Object
+        df: DataFrame chunk with an aquifer_id column as listed in the uploaded file
+        region_id: Region Id as listed in the Database
+        aq_dict: Cache of uploaded aquifer ids to database ids. Updated in place with new aquifers.
+
+    Returns:
+        The DataFrame with the aquifer_id column mapped to the database ids
+    """
+    df['aquifer_id'] = df['aquifer_id'].astype(str)
+    aquifer_ids = list(set(df['aquifer_id'].unique()) - set(aq_dict.keys()))
+    if aquifer_ids:
+        aquifers = (session.query(Aquifer).filter(Aquifer.region_id == region_id,
+                                                  Aquifer.aquifer_id.in_(aquifer_ids)).all())
+        aq_dict.update({aq.aquifer_id: aq.id for aq in aquifers})
+    df['aquifer_id'] = df['aquifer_id'].map(aq_dict)
+    return df
+
+
+def map_well_ids(session: Any, df: Any, well_dict: Dict) -> Any:
+    """
+    Map the well id column of an upload chunk to the well ids listed in the database
+
+    Args:
+        session: SQL Alchemy Session Object
+        df: DataFrame chunk with well_id and aquifer_id columns, the aquifer ids as listed in the database
+        well_dict: Cache of (aquifer id, uploaded well id) keys to database ids. Updated in place with new wells.
+
+    Returns:
+        The DataFrame with the well_id column mapped to the database ids. Wells not found in their aquifer are NaN.
+    """
+    # The same well id can exist in several aquifers, so wells are keyed by aquifer and well id
+    df['well_id'] = df['well_id'].astype(str)
+    aquifer_ids = pd.to_numeric(df['aquifer_id'], errors='coerce')
+    keys = [(int(aquifer), well) if pd.notna(aquifer) else None for aquifer, well in zip(aquifer_ids, df['well_id'])]
+    new_keys = set(keys) - set(well_dict.keys()) - {None}
+    if new_keys:
+        wells = (session.query(Well).filter(Well.aquifer_id.in_(sorted({aquifer for aquifer, _ in new_keys})),
+                                            Well.well_id.in_(sorted({well for _, well in new_keys}))).all())
+        well_dict.update({(well.aquifer_id, well.well_id): well.id for well in wells})
+    df['well_id'] = pd.to_numeric(pd.Series([well_dict.get(key) for key in keys], index=df.index, dtype=object))
+    return df
+
+
 def get_shapefile_attributes(shapefile: Any,
                              app_workspace: Any,
                              polygons: bool = True) -> Any:
@@ -442,7 +580,12 @@ def get_shapefile_attributes(shapefile: Any,
     temp_dir = None
     try:
 
-        gdf, temp_dir = get_shapefile_gdf(shapefile, app_workspace, polygons)
+        if polygons:
+            gdf, temp_dir = get_shapefile_gdf(shapefile, app_workspace, polygons)
+        else:
+            # Only the header is needed, avoid reading large point files into memory
+            chunks, temp_dir = get_upload_chunks(shapefile, app_workspace, chunk_size=1)
+            gdf = next(chunks)
 
         attributes = gdf.columns.values.tolist()
 
@@ -505,7 +648,10 @@ def process_wells_file(lat: str,
                        aquifer_id: str,
                        aquifer_col: str,
                        app_workspace: Any,
-                       region_id: int) -> Dict:
+                       region_id: int,
+                       chunk_size: Union[int, None] = UPLOAD_CHUNK_SIZE,
+                       upsert: bool = False,
+                       progress_callback: Union[Callable, None] = None) -> Dict:
     """
     Add the uploaded Wells File to the Database
 
@@ -521,6 +667,9 @@ def process_wells_file(lat: str,
         aquifer_col: Aquifer Column String
         app_workspace: Temporary Workspace Directory
         region_id: Region Id as listed in the Database
+        chunk_size: Number of rows read and written per chunk. None reads the whole file at once.
+        upsert: Update wells that already exist in the aquifer instead of failing on the duplicate
+        progress_callback: Optional function called with the number of rows processed after each chunk
 
     Returns:
         A response dict of success or failure
@@ -528,50 +677,43 @@ def process_wells_file(lat: str,
     temp_dir = None
     session = get_session_obj()
     try:
-        gdf, temp_dir = get_shapefile_gdf(file, app_workspace, polygons=False)
         rename_cols = {lat: 'latitude',
                        lon: 'longitude',
                        well_id: 'well_id',
                        name: 'well_name',
                        gse: 'gse'}
-        if len(aquifer_id) > 0:
-            gdf['aquifer_id'] = aquifer_id
-            gdf = gdf.rename(columns=rename_cols)
-
+        dtype = {well_id: str}
         if len(aquifer_col) > 0:
             rename_cols[aquifer_col] = 'aquifer_id'
-            gdf.rename(columns=rename_cols, inplace=True)
-            aquifer_ids = list(gdf['aquifer_id'].unique().astype(str))
-            aquifer = (session.query(Aquifer).filter(Aquifer.region_id == region_id,
-                                                     Aquifer.aquifer_id.in_(aquifer_ids)).all())
-            aq_dict = {aq.aquifer_id: aq.id for aq in aquifer}
-            gdf['aquifer_id'] = gdf['aquifer_id'].astype(str)
-            gdf['aquifer_id'] = gdf['aquifer_id'].map(aq_dict)
+            dtype[aquifer_col] = str
 
         attributes = None
         if attrs:
             attributes = attrs.split(',')
 
-        for row in gdf.itertuples():
-            attr_dict = {}
-            if attributes:
-                attr_dict = {attr: getattr(row, attr) for attr in attributes}
-
-            attr_dict = simplejson.dumps(attr_dict, ignore_nan=True)
-            attr_dict = json.loads(attr_dict)
-            well = Well(aquifer_id=int(row.aquifer_id),
-                        latitude=float(row.latitude),
-                        longitude=float(row.longitude),
-                        well_id=row.well_id,
-                        well_name=str(row.well_name),
-                        gse=float(row.gse),
-                        attr_dict=attr_dict,
-                        outlier=False)
-            session.add(well)
+        chunks, temp_dir = get_upload_chunks(file, app_workspace, chunk_size, dtype=dtype)
+        aq_dict = {}
+        num_rows = 0
+        for gdf in chunks:
+            gdf = gdf.rename(columns=rename_cols)
+            if len(aquifer_id) > 0:
+                gdf['aquifer_id'] = aquifer_id
+
+            if len(aquifer_col) > 0:
+                gdf = map_aquifer_ids(session, gdf, region_id, aq_dict)
+
+            well_records = build_well_records(gdf, attributes)
+            if upsert:
+                upsert_wells(session, well_records)
+            else:
+                session.bulk_insert_mappings(Well, well_records)
+            num_rows += len(well_records)
+            if progress_callback is not None:
+                progress_callback(num_rows)
         session.commit()
         session.close()
 
-        response = {'success': 'success'}
+        response = {'success': 'success', 'rows': num_rows}
 
     except Exception as e:
         session.close()
@@ -588,6 +730,64 @@ def process_wells_file(lat: str,
     return response
 
 
+def build_well_records(gdf: Any, attributes: Union[List, None]) -> List:
+    """
+    Build well table rows for a mapped upload chunk using column-wise operations
+
+    Args:
+        gdf: DataFrame chunk with the renamed well columns and mapped aquifer ids
+        attributes: List of extra attribute columns to store in attr_dict
+
+    Returns:
+        A list of dicts ready for a bulk insert into the well table
+    """
+    wells_df = pd.DataFrame({'aquifer_id': gdf['aquifer_id'].astype(int),
+                             'latitude': gdf['latitude'].astype(float),
+                             'longitude': gdf['longitude'].astype(float),
+                             'well_id': gdf['well_id'].map(str),
+                             'well_name': gdf['well_name'].map(str),
+                             'gse': gdf['gse'].astype(float),
+                             'outlier': False})
+    wells_df['geometry'] = ('SRID=4326;POINT(' + wells_df['longitude'].astype(str) + ' ' +
+                            wells_df['latitude'].astype(str) + ')')
+
+    if attributes:
+        # object dtype gives json serializable python values, missing values become null
+        attr_df = gdf[attributes].astype(object)
+        wells_df['attr_dict'] = attr_df.where(attr_df.notnull(), None).to_dict('records')
+    else:
+        wells_df['attr_dict'] = [{} for _ in range(len(wells_df))]
+
+    return wells_df.astype(object).to_dict('records')
+
+
+def upsert_wells(session: Any, well_records: List) -> None:
+    """
+    Insert wells, updating existing wells with the same aquifer and well id. Rows whose values have not
+    changed are left untouched. The outlier flag of existing wells is kept.
+
+    Args:
+        session: SQL Alchemy Session Object. The caller is responsible for committing.
+        well_records: List of well row dicts as created by build_well_records
+    """
+    if not well_records:
+        return
+
+    well_table = Well.__table__
+    stmt = pg_insert(well_table)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        constraint='_well_uc',
+        set_={col: excluded[col] for col in ['latitude', 'longitude', 'geometry', 'well_name', 'gse', 'attr_dict']},
+        where=or_(well_table.c.latitude.is_distinct_from(excluded.latitude),
+                  well_table.c.longitude.is_distinct_from(excluded.longitude),
+                  well_table.c.well_name.is_distinct_from(excluded.well_name),
+                  well_table.c.gse.is_distinct_from(excluded.gse),
+                  # json has no equality operator, compare as jsonb
+                  cast(well_table.c.attr_dict, JSONB).is_distinct_from(cast(excluded.attr_dict, JSONB))))
+    session.execute(stmt, well_records)
+
+
 def process_measurements_file(region_id: int,
                               well_id: str,
                               m_time: str,
@@ -597,7 +797,11 @@ def process_measurements_file(region_id: int,
                               file: Any,
                               aquifer_id: str,
                               aquifer_col: str,
-                              app_workspace: Any) -> Dict:
+                              app_workspace: Any,
+                              batch_size: int = MEASUREMENT_BATCH_SIZE,
+                              chunk_size: Union[int, None] = UPLOAD_CHUNK_SIZE,
+                              upsert: bool = False,
+                              progress_callback: Union[Callable, None] = None) -> Dict:
     """
     Add uploaded measurements to the database
 
@@ -612,55 +816,67 @@ def process_measurements_file(region_id: int,
         aquifer_id: Aquifer Id as selected by the user
         aquifer_col: Aquifer Id Column String
         app_workspace: Temporary App Workspace Directory
+        batch_size: Number of rows written per bulk insert batch
+        chunk_size: Number of rows read from the uploaded file per chunk. None reads the whole file at once.
+        upsert: Update measurements with the same well, variable and time instead of skipping them
+        progress_callback: Optional function called with the number of rows processed after each chunk
 
     Returns:
-        A response dict success or failure
+        A response dict success or failure. On success includes the number of rows written, the number of rows
+        skipped because the measurement is already in the database (or unchanged in upsert mode) and the
+        ingestion rate in rows/sec.
     """
 
     temp_dir = None
     session = get_session_obj()
     try:
-        gdf, temp_dir = get_shapefile_gdf(file, app_workspace, polygons=False)
+        start_time = time.time()
         rename_cols = {well_id: 'well_id',
                        m_time: 'time',
                        value: 'value'}
-        gdf = gdf.rename(columns=rename_cols)
-        gdf['variable_id'] = variable_id
-
-        if len(aquifer_id) > 0:
-            gdf['aquifer_id'] = aquifer_id
-            gdf = gdf.rename(columns=rename_cols)
-
+        dtype = {well_id: str}
         if len(aquifer_col) > 0:
             rename_cols[aquifer_col] = 'aquifer_id'
-            gdf.rename(columns=rename_cols, inplace=True)
-            aquifer_ids = list(gdf['aquifer_id'].unique().astype(str))
-            aquifers = (session.query(Aquifer).filter(Aquifer.region_id == region_id,
-                                                      Aquifer.aquifer_id.in_(aquifer_ids)).all())
-            aq_dict = {aq.aquifer_id: aq.id for aq in aquifers}
-            gdf['aquifer_id'] = gdf['aquifer_id'].astype(str)
-            gdf['aquifer_id'] = gdf['aquifer_id'].map(aq_dict)
-
-        aquifer_ids = list(gdf['aquifer_id'].unique().astype(str))
-        well_ids = list(gdf['well_id'].unique().astype(str))
-        wells = (session.query(Well).filter(Well.well_id.in_(well_ids),
-                                            Well.aquifer_id.in_(aquifer_ids)).all())
-
-        well_dict = {well.well_id: well.id for well in wells}
-        gdf['well_id'] = gdf['well_id'].astype(str)
-        gdf['well_id'] = gdf['well_id'].map(well_dict)
-        gdf.dropna(subset=['time', 'value'], inplace=True)
-        for row in gdf.itertuples():
-            measurement = Measurement(well_id=int(row.well_id),
-                                      variable_id=int(row.variable_id),
-                                      ts_time=row.time,
-                                      ts_value=float(row.value),
-                                      ts_format=time_format
-                                      )
-            session.add(measurement)
+            dtype[aquifer_col] = str
+
+        unique_index = has_measurement_unique_index(session.get_bind())
+        if upsert and not unique_index:
+            raise ValueError(UPSERT_UNAVAILABLE)
+        chunks, temp_dir = get_upload_chunks(file, app_workspace, chunk_size, dtype=dtype)
+        aq_dict = {}
+        well_dict = {}
+        num_rows = 0
+        num_written = 0
+        for gdf in chunks:
+            gdf = gdf.rename(columns=rename_cols)
+            gdf['variable_id'] = variable_id
+
+            if len(aquifer_id) > 0:
+                gdf['aquifer_id'] = aquifer_id
+
+            if len(aquifer_col) > 0:
+                gdf = map_aquifer_ids(session, gdf, region_id, aq_dict)
+
+            gdf = map_well_ids(session, gdf, well_dict)
+            gdf.dropna(subset=['well_id', 'time', 'value'], inplace=True)
+            gdf = gdf.rename(columns={'time': 'ts_time', 'value': 'ts_value'})
+            gdf['well_id'] = gdf['well_id'].astype(int)
+            gdf['variable_id'] = gdf['variable_id'].astype(int)
+            gdf['ts_value'] = gdf['ts_value'].astype(float)
+            gdf['ts_format'] = time_format
+            gdf['ts_datetime'] = parse_ts_datetime(gdf['ts_time'], time_format)
+            num_written += bulk_insert_measurements(session, gdf, batch_size, upsert, unique_index)
+            num_rows += len(gdf)
+            if progress_callback is not None:
+                progress_callback(num_rows)
         session.commit()
         session.close()
-        response = {'success': 'success'}
+        total_time = time.time() - start_time
+        response = {'success': 'success',
+                    'rows': num_written,
+                    'skipped': num_rows - num_written,
+                    'total_time': total_time,
+                    'rows_per_sec': num_rows / total_time if total_time > 0 else num_rows}
 
     except Exception as e:
         session.close()
@@ -678,23 +894,208 @@ def process_measurements_file(region_id: int,
     return response
 
 
-def get_timeseries(well_id: str, variable_id: int) -> List:
+def parse_upload_size(value: Union[str, None], default: int) -> int:
+    """
+    Parse a batch or chunk size sent with an upload form
+
+    Args:
+        value: Size as posted, empty or None uses the default
+        default: Size used when none was posted
+
+    Returns:
+        The size as a positive integer. Raises ValueError when the value is not a whole number of at least 1.
+    """
+    if value is None or str(value).strip() == '':
+        return default
+    size = int(value)
+    if size < 1:
+        raise ValueError(f'{size} is smaller than 1')
+    return size
+
+
+def measurement_upsert_available() -> bool:
+    """
+    Check if measurement uploads can update existing measurements. Upserts need the unique measurement index,
+    which is missing while an upgraded database still holds duplicate measurements.
+
+    Returns:
+        True when the unique measurement index exists
+    """
+    return has_measurement_unique_index(app.get_persistent_store_database('gwdb'))
+
+
+def bulk_insert_measurements(session: Any,
+                             measurements_df: Any,
+                             batch_size: int = MEASUREMENT_BATCH_SIZE,
+                             upsert: bool = False,
+                             unique_index: bool = True) -> int:
+    """
+    Stream a mapped measurements DataFrame into the measurement table. On PostgreSQL the rows are copied into a
+    temporary staging table with COPY FROM STDIN and merged with INSERT ... ON CONFLICT on the well/variable/time
+    key, other databases fall back to batched executemany inserts (INSERT OR IGNORE / OR REPLACE on SQLite).
+    Measurements already in the database are skipped, in upsert mode they are updated when their value changed.
+
+    Args:
+        session: SQL Alchemy Session Object. The caller is responsible for committing.
+        measurements_df: DataFrame with the well_id, variable_id, ts_time, ts_value, ts_format and ts_datetime
+            columns
+        batch_size: Number of rows written per COPY/executemany call
+        upsert: Merge the rows into existing measurements instead of skipping them
+        unique_index: Whether the unique measurement index exists, see has_measurement_unique_index. Upserts
+            need it, without it new measurements are compared with the stored ones instead.
+
+    Returns:
+        The number of rows written
+    """
+    if upsert and not unique_index:
+        raise ValueError(UPSERT_UNAVAILABLE)
+
+    connection = session.connection()
+    measurements_df = measurements_df[MEASUREMENT_COLUMNS]
+    columns = ", ".join(MEASUREMENT_COLUMNS)
+    target_table = Measurement.__tablename__
+    stage_table = f'{target_table}_stage'
+    if upsert:
+        # The natural key cannot match rows without a parsed time, and a key may only be merged once per statement
+        measurements_df = (measurements_df.dropna(subset=['ts_datetime'])
+                           .drop_duplicates(subset=MEASUREMENT_KEY, keep='last'))
+    elif not unique_index:
+        # nothing stops a measurement repeated within the upload, keep its first copy
+        repeated = measurements_df.duplicated(subset=MEASUREMENT_KEY) & measurements_df['ts_datetime'].notna()
+        measurements_df = measurements_df[~repeated]
+
+    if connection.dialect.name != 'postgresql':
+        insert_stmt = Measurement.__table__.insert()
+        if connection.dialect.name == 'sqlite':
+            insert_stmt = insert_stmt.prefix_with('OR REPLACE' if upsert else 'OR IGNORE')
+        elif upsert:
+            raise ValueError(f'Updating measurements is not supported on {connection.dialect.name} databases')
+        num_written = 0
+        for start in range(0, len(measurements_df), batch_size):
+            batch_df = measurements_df.iloc[start:start + batch_size]
+            # astype(object) hands the DBAPI native python types instead of numpy scalars
+            records = batch_df.astype(object).where(batch_df.notnull(), None).to_dict('records')
+            rowcount = connection.execute(insert_stmt, records).rowcount
+            num_written += rowcount if rowcount >= 0 else len(records)
+        return num_written
+
+    connection.execute(text(f'CREATE TEMPORARY TABLE IF NOT EXISTS {stage_table} AS '
+                            f'SELECT {columns} FROM {target_table} WITH NO DATA'))
+    connection.execute(text(f'TRUNCATE {stage_table}'))
+
+    copy_sql = f'COPY {stage_table} ({columns}) FROM STDIN WITH (FORMAT csv)'
+    for start in range(0, len(measurements_df), batch_size):
+        buffer = io.StringIO()
+        measurements_df.iloc[start:start + batch_size].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(copy_sql, buffer)
+        cursor.close()
+
+    insert_sql = f'INSERT INTO {target_table} ({columns}) SELECT {columns} FROM {stage_table} '
+    if upsert:
+        key = ", ".join(MEASUREMENT_KEY)
+        result = connection.execute(text(
+            f'{insert_sql}ON CONFLICT ({key}) DO UPDATE SET ts_value = EXCLUDED.ts_value, '
+            f'ts_time = EXCLUDED.ts_time, ts_format = EXCLUDED.ts_format '
+            f'WHERE {target_table}.ts_value IS DISTINCT FROM EXCLUDED.ts_value'))
+    elif unique_index:
+        result = connection.execute(text(f'{insert_sql}ON CONFLICT DO NOTHING'))
+    else:
+        # ON CONFLICT has no index to detect the measurements already stored, look them up instead
+        key_match = ' AND '.join(f'{target_table}.{col} = {stage_table}.{col}' for col in MEASUREMENT_KEY)
+        result = connection.execute(text(f'{insert_sql}WHERE NOT EXISTS '
+                                         f'(SELECT 1 FROM {target_table} WHERE {key_match})'))
+    return result.rowcount
+
+
+def create_job_status(job_type: str) -> str:
+    """
+    Add a new pending job to the Job Status table
+
+    Args:
+        job_type: Kind of work the job does, e.g. wells, measurements or aquifer
+
+    Returns:
+        The job id
+    """
+    session = get_session_obj()
+    job_id = str(uuid.uuid4())
+    session.add(JobStatus(id=job_id, job_type=job_type))
+    session.commit()
+    session.close()
+    return job_id
+
+
+def update_job_status(job_id: str, **kwargs: Any) -> None:
+    """
+    Update the status, progress, message or result of a job
+
+    Args:
+        job_id: Job id as listed in the Job Status table
+        kwargs: JobStatus columns to update
+    """
+    session = get_session_obj()
+    job = session.query(JobStatus).get(job_id)
+    for key, val in kwargs.items():
+        setattr(job, key, val)
+    job.updated = datetime.utcnow()
+    session.commit()
+    session.close()
+
+
+def get_job_status(job_id: str) -> Union[Dict, None]:
+    """
+    Get the current state of a job
+
+    Args:
+        job_id: Job id as listed in the Job Status table
+
+    Returns:
+        A dict with the job status, progress, message and result. None if the job does not exist.
+    """
+    session = get_session_obj()
+    job = session.query(JobStatus).get(job_id)
+    job_dict = None
+    if job is not None:
+        job_dict = {'job_id': job.id,
+                    'job_type': job.job_type,
+                    'status': job.status,
+                    'progress': job.progress,
+                    'message': job.message,
+                    'result': job.result}
+    session.close()
+    return job_dict
+
+
+def get_timeseries(well_id: str,
+                   variable_id: int,
+                   start_date: Union[datetime, None] = None,
+                   end_date: Union[datetime, None] = None) -> List:
     """
     Generate Highcharts appropriate timeseries list
 
     Args:
         well_id: Well Id string as stored in the Measurement Table
         variable_id: Variable Id integer as stored in the variable/measurement table
+        start_date: Optional earliest measurement time to return
+        end_date: Optional latest measurement time to return
 
     Returns:
         list of lists with utc time in milliseconds and measurement value
     """
     session = get_session_obj()
     well_id = well_id.split('.')[1]
-    ts_obj = session.query(Measurement).filter(Measurement.well_id == well_id,
-                                               Measurement.variable_id == variable_id).all()
-    timeseries = sorted([[calendar.timegm(datetime.strptime(obj.ts_time, obj.ts_format).utctimetuple())*1000,
-                          obj.ts_value] for obj in ts_obj])
+    ts_query = (session.query(Measurement.ts_datetime, Measurement.ts_value)
+                .filter(Measurement.variable_id == variable_id,
+                        Measurement.well_id == well_id,
+                        Measurement.ts_datetime.isnot(None)))
+    if start_date is not None:
+        ts_query = ts_query.filter(Measurement.ts_datetime >= start_date)
+    if end_date is not None:
+        ts_query = ts_query.filter(Measurement.ts_datetime <= end_date)
+    ts_obj = ts_query.order_by(Measurement.ts_datetime, Measurement.ts_value).all()
+    timeseries = [[calendar.timegm(obj.ts_datetime.utctimetuple())*1000, obj.ts_value] for obj in ts_obj]
     session.close()
     return timeseries
 